@@ -162,6 +162,11 @@ int main(void) {
 	struct tm ts;
 	time_t timestamp;
 
+	/* The configuration file is parsed again only when it changes (the python script replaces it atomically) */
+	struct stat configStat;
+	time_t configMtime = 0;
+	ino_t configInode = 0;
+
 	/* The main daemon loop starts here */
 	while(1){
 
@@ -170,12 +175,21 @@ int main(void) {
 		time(&timestamp);
 		ts = *localtime(&timestamp);
 		
-		/* Update sunset and sunrise variables from .config file */
-		getVal(file_name,field_sunrise,&sunrise,F_INTEGER,1);
-		getVal(file_name,field_sunset,&sunset,F_INTEGER,1);
-		// Log the retrieved data
-		sprintf(dataMessage, "I retrieved the following data for sunrise and sunset: sunrise %d, sunset %d",sunrise,sunset);
-		NewLog(fpLog, LOG_SEVERITY_INFO, dataMessage, verbose);
+		/* Update sunset and sunrise variables from .config file, if it changed since the last loop */
+		if(stat(file_name,&configStat) != 0){
+			configMtime = 0;
+		}
+		if(configMtime == 0 || configStat.st_mtime != configMtime || configStat.st_ino != configInode){
+			getVal(file_name,field_sunrise,&sunrise,F_INTEGER,1);
+			getVal(file_name,field_sunset,&sunset,F_INTEGER,1);
+			if(stat(file_name,&configStat) == 0){
+				configMtime = configStat.st_mtime;
+				configInode = configStat.st_ino;
+			}
+			// Log the retrieved data
+			sprintf(dataMessage, "I retrieved the following data for sunrise and sunset: sunrise %d, sunset %d",sunrise,sunset);
+			NewLog(fpLog, LOG_SEVERITY_INFO, dataMessage, verbose);
+		}
 
 		if(ts.tm_hour<sunrise-1 || ts.tm_hour>sunset){
 			logMessage = "It is night, so I will not update the solar radiation forecast.";
@@ -0,0 +1,77 @@
+'''
+
+*** Benchmark: multi-site batch forecast ***
+
+Abstract:
+    Measures how many sites per second are evaluated by forecast_batch(), at 1-minute step over a 6-day horizon,
+    and compares it with calling forecast() once per site. The batch is then repeated with the default solar geometry cache,
+    already filled by a first run, as in an hourly re-forecast of the same sites, and the hits of the cache are reported.
+    Finally the batch is repeated with a cache smaller than the geometry of the batch, which is then not used (0 lookups),
+    so that it is not slower than without cache.
+
+    Usage:
+        python3 benchmarks/bench_batch_forecast.py [number of sites]
+
+'''
+
+import os
+import sys
+import time as tempo
+import datetime
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pv_forecast_engine import GeometryCache, forecast, forecast_batch, geometry_cache
+
+STEP = 60 # [seconds]
+FORECAST_HORIZON = 6 # [days]
+TIMEZONE = "Europe/Rome" # all the sites are in Italy
+
+
+def main(argv):
+    n_sites = int(argv[1]) if len(argv) > 1 else 500
+    rng = np.random.default_rng(0)
+    lat = rng.uniform(36, 47, n_sites)
+    lon = rng.uniform(6, 18, n_sites)
+    tilt = rng.uniform(0, 40, n_sites)
+    declination = rng.uniform(-45, 45, n_sites)
+    dt_start = datetime.datetime.combine(datetime.datetime.now().date(), datetime.time(0,0,0))
+
+    # One site at a time (what a process per site does, without the startup cost)
+    n_loop = min(n_sites, 50)
+    t0 = tempo.perf_counter()
+    for i in range(n_loop):
+        forecast(lat[i], lon[i], tilt[i], declination[i], dt_start, FORECAST_HORIZON, STEP, cache=None, timezone=TIMEZONE)
+    loop_rate = n_loop / (tempo.perf_counter() - t0)
+
+    # All sites in one broadcasted pass
+    t0 = tempo.perf_counter()
+    sim_time_array, irradiation_total = forecast_batch(lat, lon, tilt, declination, dt_start, FORECAST_HORIZON, STEP, cache=None, timezone=TIMEZONE)
+    batch_rate = n_sites / (tempo.perf_counter() - t0)
+
+    # Same batch again, with the geometry of all the sites already in the default cache
+    forecast_batch(lat, lon, tilt, declination, dt_start, FORECAST_HORIZON, STEP, timezone=TIMEZONE)
+    hits, misses = geometry_cache.hits, geometry_cache.misses
+    t0 = tempo.perf_counter()
+    forecast_batch(lat, lon, tilt, declination, dt_start, FORECAST_HORIZON, STEP, timezone=TIMEZONE)
+    cached_rate = n_sites / (tempo.perf_counter() - t0)
+    hits, misses = geometry_cache.hits - hits, geometry_cache.misses - misses
+
+    # Same batch again, with a cache of half the size of the geometry of the batch
+    small_cache = GeometryCache(max_bytes=geometry_cache.nbytes // 2)
+    forecast_batch(lat, lon, tilt, declination, dt_start, FORECAST_HORIZON, STEP, cache=small_cache, timezone=TIMEZONE)
+    t0 = tempo.perf_counter()
+    forecast_batch(lat, lon, tilt, declination, dt_start, FORECAST_HORIZON, STEP, cache=small_cache, timezone=TIMEZONE)
+    small_rate = n_sites / (tempo.perf_counter() - t0)
+
+    print("Grid: %d sites x %d steps (step %d s, horizon %d days)" % (irradiation_total.shape + (STEP, FORECAST_HORIZON)))
+    print("forecast() per site : %10.1f sites/s" % loop_rate)
+    print("forecast_batch()    : %10.1f sites/s (x%.1f)" % (batch_rate, batch_rate / loop_rate))
+    print("warm geometry cache : %10.1f sites/s (x%.1f), %d hits out of %d lookups, %.1f MB" %
+          (cached_rate, cached_rate / loop_rate, hits, hits + misses, geometry_cache.nbytes / 2**20))
+    print("undersized cache    : %10.1f sites/s (x%.1f), %d hits out of %d lookups, %.1f MB" %
+          (small_rate, small_rate / loop_rate, small_cache.hits, small_cache.hits + small_cache.misses, small_cache.max_bytes / 2**20))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,60 @@
+'''
+
+*** Benchmark: ensemble forecast ***
+
+Abstract:
+    Time and peak memory of ensemble_forecast (P10/P50/P90 of M realizations of the cloud noise) at 1-minute step over a
+    6-day horizon, for an increasing number of members, compared with the one-shot (members x timesteps) computation. The
+    random draws of the two computations differ, so their percentiles agree only statistically (mean absolute difference).
+
+    Usage:
+        python3 benchmarks/bench_ensemble.py [members]
+
+'''
+
+import os
+import sys
+import tracemalloc
+import time as tempo
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pv_forecast_engine import ensemble_forecast, cloud_noise
+from pv_smoothing import Smoother
+
+STEP = 60 # [seconds]
+FORECAST_HORIZON = 6 # [days]
+
+
+def measure(function):
+    tracemalloc.start()
+    t0 = tempo.perf_counter()
+    result = function()
+    elapsed = tempo.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main(argv):
+    members_list = [int(argv[1])] if len(argv) > 1 else [100, 300, 1000]
+    rng = np.random.default_rng(0)
+    n = FORECAST_HORIZON * 86400 // STEP
+    irradiations = np.clip(1000 * np.sin(np.linspace(0, FORECAST_HORIZON * 2 * np.pi, n)), 0, None)
+    cloud_array = rng.uniform(0, 1, n)
+    smoother = Smoother(105, STEP)
+    print("Timesteps: %d" % n)
+
+    for members in members_list:
+        quantiles, elapsed, peak = measure(lambda: ensemble_forecast(irradiations, cloud_array, members, smoother,
+                                                                     rng=np.random.default_rng(1)))
+        print("%5d members, segments : %8.3f s, peak %8.1f MB" % (members, elapsed, peak / 2**20))
+        one_shot = lambda: np.percentile(smoother.smooth(irradiations * cloud_noise(cloud_array, members, np.random.default_rng(1))),
+                                         (10, 50, 90), axis=0)
+        reference, elapsed, peak = measure(one_shot)
+        print("%5d members, one shot : %8.3f s, peak %8.1f MB, mean difference %.2f W/m2" %
+              (members, elapsed, peak / 2**20, np.abs(np.array(list(quantiles.values())) - reference).mean()))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
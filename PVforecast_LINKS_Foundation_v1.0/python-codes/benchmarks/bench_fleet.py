@@ -0,0 +1,61 @@
+'''
+
+*** Benchmark: multi-process forecast of a fleet of sites ***
+
+Abstract:
+    Computes the clear sky irradiation of many sites, at 1-minute step over a 6-day horizon, with forecast_batch() in one
+    process and then with pv_fleet.FleetRunner for 1, 2, ... up to the number of cores worker processes. For each number of
+    workers it reports the time, the sites per second and the speedup over one worker, and checks that the result is the
+    same as forecast_batch(). The worker processes are started before the timing, as in a long-lived daemon.
+
+    Usage:
+        python3 benchmarks/bench_fleet.py [number of sites] [maximum number of workers]
+
+'''
+
+import os
+import sys
+import time as tempo
+import datetime
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pv_forecast_engine import forecast_batch
+from pv_fleet import FleetRunner
+
+STEP = 60 # [seconds]
+FORECAST_HORIZON = 6 # [days]
+TIMEZONE = "Europe/Rome" # all the sites are in Italy
+
+
+def main(argv):
+    n_sites = int(argv[1]) if len(argv) > 1 else 1000
+    max_workers = int(argv[2]) if len(argv) > 2 else os.cpu_count()
+    rng = np.random.default_rng(0)
+    lat = rng.uniform(36, 47, n_sites)
+    lon = rng.uniform(6, 18, n_sites)
+    tilt = rng.uniform(0, 40, n_sites)
+    declination = rng.uniform(-45, 45, n_sites)
+    dt_start = datetime.datetime.combine(datetime.datetime.now().date(), datetime.time(0,0,0))
+
+    t0 = tempo.perf_counter()
+    sim_time_array, expected = forecast_batch(lat, lon, tilt, declination, dt_start, FORECAST_HORIZON, STEP, cache=None, timezone=TIMEZONE)
+    batch = tempo.perf_counter() - t0
+    print("Grid: %d sites x %d steps (step %d s, horizon %d days), %d cores" % (expected.shape + (STEP, FORECAST_HORIZON, os.cpu_count())))
+    print("forecast_batch() : %8.2f s, %8.1f sites/s" % (batch, n_sites / batch))
+
+    single = None
+    for workers in range(1, max_workers + 1):
+        with FleetRunner(workers) as runner:
+            # Warm-up on a few sites, so that the processes are already started
+            runner.forecast(lat[:workers], lon[:workers], tilt[:workers], declination[:workers], dt_start, 1, STEP, timezone=TIMEZONE)
+            t0 = tempo.perf_counter()
+            sim_time_array, irradiation_total = runner.forecast(lat, lon, tilt, declination, dt_start, FORECAST_HORIZON, STEP, timezone=TIMEZONE)
+            seconds = tempo.perf_counter() - t0
+        single = seconds if single is None else single
+        print("%2d workers       : %8.2f s, %8.1f sites/s (x%.2f), max difference %.1e" %
+              (workers, seconds, n_sites / seconds, single / seconds, np.abs(irradiation_total - expected).max()))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,70 @@
+'''
+
+*** Benchmark: incremental intraday re-forecast ***
+
+Abstract:
+    Simulates the hourly re-forecasts of two days (from 04:00 to 22:00) of one site, and compares the time of the full
+    re-forecast from 00:00 (forecast -> cloud noise -> smoothing, without geometry cache) with the incremental one
+    (pv_intraday.IntradayForecast), which reuses the clear sky series and computes only the timesteps from the current one.
+    The weather forecast changes every 3 hours.
+
+    Usage:
+        python3 benchmarks/bench_intraday.py [step in seconds] [horizon in days]
+
+'''
+
+import os
+import sys
+import time as tempo
+import datetime
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pv_forecast_engine import forecast, addNoise
+from pv_intraday import IntradayForecast
+from pv_smoothing import Smoother
+from pv_weather import WeatherForecast, WEATHER_FIELDS
+
+LATITUDE = 45.065262
+LONGITUDE = 7.659192
+TIMEZONE = "Europe/Rome"
+
+
+def synthetic_weather(rng, days=7):
+    return WeatherForecast(dict((name, rng.uniform(0, 100, days * 8)) for name, key in WEATHER_FIELDS))
+
+
+def main(argv):
+    step = int(argv[1]) if len(argv) > 1 else 60
+    horizon = int(argv[2]) if len(argv) > 2 else 6
+    rng = np.random.default_rng(0)
+    smoother = Smoother(105, step)
+    intraday = IntradayForecast(LATITUDE, LONGITUDE, 0, 0, horizon, step, smoother, TIMEZONE, rng=rng, cache=None)
+    day = datetime.datetime.combine(datetime.datetime.now().date(), datetime.time(0,0,0))
+    full = incremental = 0.0
+    runs = 0
+    weather = None
+    for hour in [24 * d + h for d in range(2) for h in range(4, 23)]:
+        now = day + datetime.timedelta(hours=hour, minutes=7)
+        if weather is None or hour % 3 == 0:
+            weather = synthetic_weather(rng)
+        dt_start = datetime.datetime.combine(now.date(), datetime.time(0,0,0))
+
+        t0 = tempo.perf_counter()
+        sim_time_array, irradiation_total = forecast(LATITUDE, LONGITUDE, 0, 0, dt_start, horizon, step, cache=None, timezone=TIMEZONE)
+        appliedNoiseIrradiation, WD = addNoise(irradiation_total, step, LATITUDE, LONGITUDE, rng=rng, weather=weather)
+        smoother.smooth(appliedNoiseIrradiation)
+        t1 = tempo.perf_counter()
+        intraday.update(now, weather)
+        t2 = tempo.perf_counter()
+        full += t1 - t0
+        incremental += t2 - t1
+        runs += 1
+
+    print("Runs: %d, timesteps per run: %d" % (runs, len(irradiation_total)))
+    print("full re-forecast        : %8.2f ms per run" % (full / runs * 1000))
+    print("incremental re-forecast : %8.2f ms per run (x%.1f)" % (incremental / runs * 1000, full / incremental))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
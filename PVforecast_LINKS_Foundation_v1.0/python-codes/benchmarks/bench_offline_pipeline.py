@@ -0,0 +1,72 @@
+'''
+
+*** Benchmark: offline forecast pipeline for many sites ***
+
+Abstract:
+    Runs the forecast -> cloud noise -> convolution pipeline for many sites without network, using a FileProvider
+    with a synthetic weather forecast. It reports the time spent in each stage and the sites/s of the whole pipeline.
+
+    Usage:
+        python3 benchmarks/bench_offline_pipeline.py [number of sites] [step in seconds] [horizon in days]
+
+'''
+
+import os
+import sys
+import json
+import tempfile
+import time as tempo
+import datetime
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pv_forecast_engine import forecast_batch, addNoise, convolution
+from pv_weather import FileProvider
+
+TIMEZONE = "Europe/Rome" # all the sites are in Italy
+
+
+def synthetic_payload(rng, days=7):
+    '''
+    Weather forecast in the WEATHER UNLOCKED format, with random cloud cover and temperature.
+    '''
+    return {'Days': [{'Timeframes': [{'cloudtotal_pct': int(rng.integers(0, 101)),
+                                      'cloud_low_pct': int(rng.integers(0, 101)),
+                                      'cloud_mid_pct': int(rng.integers(0, 101)),
+                                      'cloud_high_pct': int(rng.integers(0, 101)),
+                                      'temp_c': float(rng.uniform(-5, 35))} for h in range(8)]} for d in range(days)]}
+
+
+def main(argv):
+    n_sites = int(argv[1]) if len(argv) > 1 else 1000
+    step = int(argv[2]) if len(argv) > 2 else 300
+    horizon = int(argv[3]) if len(argv) > 3 else 3
+    rng = np.random.default_rng(0)
+    lat = rng.uniform(36, 47, n_sites)
+    lon = rng.uniform(6, 18, n_sites)
+    dt_start = datetime.datetime.combine(datetime.datetime.now().date(), datetime.time(0,0,0))
+
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, "default.json"), "w") as f:
+            json.dump(synthetic_payload(rng), f)
+        provider = FileProvider(directory)
+
+        t0 = tempo.perf_counter()
+        sim_time_array, irradiation_total = forecast_batch(lat, lon, 0, 0, dt_start, horizon, step, timezone=TIMEZONE)
+        t1 = tempo.perf_counter()
+        weathers = provider.get_many(lat, lon)
+        t2 = tempo.perf_counter()
+        for i in range(n_sites):
+            appliedNoiseIrradiation, WD = addNoise(irradiation_total[i], step, lat[i], lon[i], rng=rng, weather=weathers[i])
+            final_results = convolution(appliedNoiseIrradiation)
+        t3 = tempo.perf_counter()
+
+    print("Sites: %d, steps per site: %d (step %d s, horizon %d days)" % (n_sites, len(sim_time_array), step, horizon))
+    print("Clear sky (forecast_batch)    : %8.3f s" % (t1 - t0))
+    print("Weather (FileProvider)        : %8.3f s" % (t2 - t1))
+    print("Noise + convolution           : %8.3f s" % (t3 - t2))
+    print("Pipeline                      : %8.1f sites/s" % (n_sites / (t3 - t0)))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
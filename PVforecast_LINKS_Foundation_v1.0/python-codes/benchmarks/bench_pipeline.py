@@ -0,0 +1,124 @@
+'''
+
+*** Benchmark: asynchronous forecast pipeline ***
+
+Abstract:
+    Runs the forecast of many sites, with a weather provider and an MQTT broker which answer after a fixed latency (no
+    network), first one site after the other (fetch -> forecast -> noise and smoothing -> publish -> log), then with the
+    asyncio pipeline (pv_pipeline), which overlaps the fetch with the computation and publishes and logs concurrently.
+    It reports the total time and the mean end-to-end latency of a site (with many sites in flight, the latency includes the
+    time waiting for the publisher), then the latency of the cycle of a single site.
+
+    Usage:
+        python3 benchmarks/bench_pipeline.py [number of sites] [weather latency in ms] [broker latency in ms]
+
+'''
+
+import os
+import sys
+import tempfile
+import asyncio
+import datetime
+import time as tempo
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pv_forecast_engine import forecast, addNoise
+from pv_publisher import ForecastPublisher, forecast_timestamps, select_timesteps, issue_timestamp, upload_forecast
+from pv_prediction_log import save_forecast
+from pv_pipeline import ForecastPipeline
+from pv_smoothing import Smoother
+from pv_weather import WeatherProvider, WEATHER_FIELDS
+
+TIMEZONE = "Europe/Rome" # all the sites are in Italy
+STEP = 300 # [seconds]
+FORECAST_HORIZON = 6 # [days]
+
+
+class SlowProvider(WeatherProvider):
+    '''
+    Synthetic weather forecast, returned after a fixed latency (as a web service).
+    '''
+
+    def __init__(self, latency):
+        WeatherProvider.__init__(self)
+        self.latency = latency
+
+    def fetch(self, lat, lon):
+        tempo.sleep(self.latency)
+        rng = np.random.default_rng(int(abs(lat * 1000 + lon)))
+        return {'Days': [{'Timeframes': [dict((key, float(rng.uniform(0, 100))) for name, key in WEATHER_FIELDS)
+                                         for h in range(8)]} for d in range(7)]}
+
+
+class SlowMessage(object):
+
+    def __init__(self, latency):
+        self.rc = 0
+        self.ready = tempo.perf_counter() + latency
+
+    def is_published(self):
+        return tempo.perf_counter() >= self.ready
+
+    def wait_for_publish(self, timeout=None):
+        tempo.sleep(max(0.0, self.ready - tempo.perf_counter()))
+
+
+class SlowClient(object):
+    '''
+    MQTT client whose messages are acknowledged after a fixed latency.
+    '''
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def max_inflight_messages_set(self, n):
+        pass
+
+    def publish(self, topic, payload, qos=0):
+        return SlowMessage(self.latency)
+
+
+def main(argv):
+    n_sites = int(argv[1]) if len(argv) > 1 else 40
+    weather_latency = (float(argv[2]) if len(argv) > 2 else 200) / 1000
+    broker_latency = (float(argv[3]) if len(argv) > 3 else 20) / 1000
+    rng = np.random.default_rng(0)
+    sites = list(zip(rng.uniform(36, 47, n_sites).round(4), rng.uniform(6, 18, n_sites).round(4)))
+    provider = SlowProvider(weather_latency)
+    smoother = Smoother(105, STEP)
+    print("Sites: %d, weather latency: %d ms, broker latency: %d ms" % (n_sites, weather_latency * 1000, broker_latency * 1000))
+
+    with tempfile.TemporaryDirectory() as directory:
+        publisher = ForecastPublisher(SlowClient(broker_latency))
+        latencies = []
+        t0 = tempo.perf_counter()
+        for i, site in enumerate(sites):
+            start = tempo.perf_counter()
+            dt_start = datetime.datetime.combine(datetime.datetime.now().date(), datetime.time(0,0,0))
+            sim_time_array, irradiation_total = forecast(site[0], site[1], 0, 0, dt_start, FORECAST_HORIZON, STEP, timezone=TIMEZONE)
+            appliedNoiseIrradiation, WD = addNoise(irradiation_total, STEP, site[0], site[1], rng=rng, provider=provider)
+            final_results = smoother.smooth(appliedNoiseIrradiation)
+            timestamps, existing = forecast_timestamps(dt_start, STEP, len(final_results))
+            timestamps, irradiation_total, final_results, WD = select_timesteps(existing, timestamps, irradiation_total, final_results, WD)
+            issue_time = issue_timestamp()
+            upload_forecast(publisher, timestamps, final_results, issue_time, site)
+            save_forecast(directory, timestamps, irradiation_total, final_results, WD, issue_time, site, file_name="log-sequential-%d.csv" % i)
+            latencies.append(tempo.perf_counter() - start)
+        sequential = tempo.perf_counter() - t0
+        print("sequential : %8.2f s, %6.1f sites/s, mean latency %8.1f ms" % (sequential, n_sites / sequential, np.mean(latencies) * 1000))
+
+        pipeline = ForecastPipeline(ForecastPublisher(SlowClient(broker_latency)), provider, FORECAST_HORIZON, STEP, smoother,
+                                    TIMEZONE, log_dir=directory, rng=rng)
+        t0 = tempo.perf_counter()
+        summary = asyncio.run(pipeline.run(sites))
+        concurrent = tempo.perf_counter() - t0
+        print("pipeline   : %8.2f s, %6.1f sites/s, mean latency %8.1f ms (x%.1f)" %
+              (concurrent, n_sites / concurrent, np.mean([s['latency'] for s in summary.values()]) * 1000, sequential / concurrent))
+        # End-to-end latency of the cycle of a single site (mean of a few cycles)
+        single = np.mean([asyncio.run(pipeline.run(sites[:1]))[sites[0]]['latency'] for i in range(5)])
+        print("one site   : sequential %8.1f ms, pipeline %8.1f ms" % (np.mean(latencies) * 1000, single * 1000))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
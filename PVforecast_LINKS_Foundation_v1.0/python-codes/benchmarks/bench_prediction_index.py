@@ -0,0 +1,87 @@
+'''
+
+*** Benchmark: prediction log index ***
+
+Abstract:
+    Writes the logs of one month of hourly forecast runs (5-minute step, 3-day horizon), then compares the time needed to
+    answer "what did the last 24 runs forecast for a given time" by opening all the logs with the time needed by the index
+    (pv_prediction_index), including the (incremental) indexing time of the logs.
+
+    Usage:
+        python3 benchmarks/bench_prediction_index.py [runs]
+
+'''
+
+import os
+import sys
+import csv
+import tempfile
+import time as tempo
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pv_prediction_log import write_prediction_log
+from pv_prediction_index import PredictionIndex, issue_time_of
+
+STEP = 300 # [seconds]
+FORECAST_HORIZON = 3 # [days]
+RUNS = 30 * 24
+SITE = (45.065262, 7.659192)
+
+
+def scan_logs(directory, target_time, last):
+    '''
+    Answer the query without the index: every log is opened and read until the target time.
+    '''
+    revisions = []
+    for name in sorted(os.listdir(directory)):
+        if not name.startswith("log-"):
+            continue
+        with open(os.path.join(directory, name), 'r', newline='') as csv_file:
+            reader = csv.reader(csv_file, delimiter=';')
+            next(reader)
+            for row in reader:
+                if int(row[0]) == target_time:
+                    revisions.append((issue_time_of(name), float(row[2])))
+                    break
+    return revisions[-last:]
+
+
+def main(argv):
+    runs = int(argv[1]) if len(argv) > 1 else RUNS
+    rng = np.random.default_rng(0)
+    n = FORECAST_HORIZON * 86400 // STEP
+    start = 1561932000 # 2019-07-01 00:00 UTC
+
+    with tempfile.TemporaryDirectory() as directory:
+        for run in range(runs):
+            issue = start + run * 3600
+            day_start = issue - issue % 86400
+            timestamps = day_start * 1000 + np.arange(n, dtype=np.int64) * STEP * 1000
+            WD = dict((name, rng.integers(0, 101, n).astype(float)) for name in
+                      ('cloud_low_level', 'cloud_mid_level', 'cloud_high_level', 'cloud_total_perceptions', 'temperature'))
+            file_name = "log-" + tempo.strftime('%Y-%m-%d-%H-%M-%S', tempo.localtime(issue)) + ".csv"
+            write_prediction_log(os.path.join(directory, file_name), timestamps, rng.uniform(0, 1000, n), rng.uniform(0, 1000, n), WD)
+        target_time = (start + (runs // 24) * 86400 + 14 * 3600) * 1000
+        print("Runs: %d, timesteps per run: %d" % (runs, n))
+
+        t0 = tempo.perf_counter()
+        scanned = scan_logs(directory, target_time, 24)
+        print("scan of the logs  : %10.2f ms" % ((tempo.perf_counter() - t0) * 1000))
+
+        index = PredictionIndex(os.path.join(directory, "index.sqlite"))
+        t0 = tempo.perf_counter()
+        index.update(directory, SITE)
+        print("indexing (once)   : %10.2f ms" % ((tempo.perf_counter() - t0) * 1000))
+        t0 = tempo.perf_counter()
+        revisions = index.revisions(SITE, target_time, last=24)
+        print("index revisions   : %10.2f ms" % ((tempo.perf_counter() - t0) * 1000))
+        t0 = tempo.perf_counter()
+        points = index.query(SITE, target_time - 86400000, target_time + 86400000)
+        print("index 2-day range : %10.2f ms (%d points)" % ((tempo.perf_counter() - t0) * 1000, len(points)))
+        assert [forecast for issue, forecast in scanned] == revisions['forecast'].tolist()
+        index.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv)
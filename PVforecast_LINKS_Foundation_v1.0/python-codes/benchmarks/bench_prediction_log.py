@@ -0,0 +1,65 @@
+'''
+
+*** Benchmark: prediction log writing ***
+
+Abstract:
+    Compares the rows/s of the previous prediction log writing (the file is opened and closed for each row) with the
+    single buffered pass of pv_prediction_log, plain and gzip compressed, at 1-minute step over a 6-day horizon.
+    Run it on the storage used by the gateway (e.g. the SD card) by passing a directory on it.
+
+    Usage:
+        python3 benchmarks/bench_prediction_log.py [directory]
+
+'''
+
+import os
+import sys
+import csv
+import tempfile
+import time as tempo
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pv_prediction_log import LOG_TITLE, write_prediction_log
+
+STEP = 60 # [seconds]
+FORECAST_HORIZON = 6 # [days]
+
+
+def reopen_per_row(file_path, timestamps, irradiation_total, final_results, WD):
+    '''
+    The previous log writing: one open/close for each row.
+    '''
+    with open(file_path, 'w', newline='') as csv_file:
+        csv.writer(csv_file, delimiter=';').writerow(LOG_TITLE)
+    for i in range(len(final_results)):
+        logDataLine = [int(timestamps[i]),str(irradiation_total[i]),str(final_results[i]),WD['cloud_low_level'][i],WD['cloud_mid_level'][i],WD['cloud_high_level'][i],WD['cloud_total_perceptions'][i],WD['temperature'][i]]
+        with open(file_path, 'a', newline='') as csv_file:
+            csv.writer(csv_file, delimiter=';').writerow(logDataLine)
+
+
+def main(argv):
+    rng = np.random.default_rng(0)
+    n = FORECAST_HORIZON * 86400 // STEP
+    timestamps = 1561932000000 + np.arange(n, dtype=np.int64) * STEP * 1000
+    irradiation_total = rng.uniform(0, 1000, n)
+    final_results = rng.uniform(0, 1000, n)
+    WD = dict((name, rng.integers(0, 101, n).astype(float)) for name in
+              ('cloud_low_level', 'cloud_mid_level', 'cloud_high_level', 'cloud_total_perceptions', 'temperature'))
+
+    with tempfile.TemporaryDirectory(dir=argv[1] if len(argv) > 1 else None) as directory:
+        print("Rows: %d, directory: %s" % (n, directory))
+        for name, write in (("reopen per row", lambda path: reopen_per_row(path, timestamps, irradiation_total, final_results, WD)),
+                            ("buffered", lambda path: write_prediction_log(path, timestamps, irradiation_total, final_results, WD)),
+                            ("buffered gzip", lambda path: write_prediction_log(path, timestamps, irradiation_total, final_results, WD, compress=True))):
+            file_path = os.path.join(directory, name.replace(" ", "-") + ".csv")
+            t0 = tempo.perf_counter()
+            write(file_path)
+            os.sync()
+            seconds = tempo.perf_counter() - t0
+            size = sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory) if f.startswith(name.replace(" ", "-")))
+            print("%-15s: %10.0f rows/s, %8d bytes" % (name, n / seconds, size))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,58 @@
+'''
+
+*** Benchmark: smoothing of the forecast ***
+
+Abstract:
+    Compares the time needed by np.convolve (box window, as in convolution()) with the cumulative sum moving average of
+    pv_smoothing, for increasing window widths, on many sites at 1-minute step over a 6-day horizon. The whole grid is then
+    smoothed segment by segment (streaming) and compared with the one-shot result.
+
+    Usage:
+        python3 benchmarks/bench_smoothing.py [number of sites]
+
+'''
+
+import os
+import sys
+import time as tempo
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pv_smoothing import Smoother
+
+STEP = 60 # [seconds]
+FORECAST_HORIZON = 6 # [days]
+SEGMENT_STEPS = 1440 # one day per segment
+
+
+def main(argv):
+    n_sites = int(argv[1]) if len(argv) > 1 else 200
+    n = FORECAST_HORIZON * 86400 // STEP
+    series = np.random.default_rng(0).uniform(0, 1000, (n_sites, n))
+    print("Grid: %d sites x %d steps" % series.shape)
+
+    for window_minutes in (21, 105, 601):
+        smoother = Smoother(window_minutes, STEP)
+        box = np.ones(smoother.window) / smoother.window
+        t0 = tempo.perf_counter()
+        convolved = np.array([np.convolve(row, box, mode='same') for row in series])
+        t1 = tempo.perf_counter()
+        smoothed = smoother.smooth(series)
+        t2 = tempo.perf_counter()
+        print("window %4d min: np.convolve %8.3f s, cumulative sum %8.3f s (x%.1f), max difference %.1e" %
+              (window_minutes, t1 - t0, t2 - t1, (t1 - t0) / (t2 - t1), np.abs(convolved - smoothed).max()))
+
+    for method in ('moving_average', 'savgol', 'exponential'):
+        smoother = Smoother(105, STEP, method)
+        t0 = tempo.perf_counter()
+        smoothed = smoother.smooth(series)
+        t1 = tempo.perf_counter()
+        stream = smoother.stream()
+        segments = [stream.push(series[:, i:i+SEGMENT_STEPS]) for i in range(0, n, SEGMENT_STEPS)] + [stream.flush()]
+        t2 = tempo.perf_counter()
+        print("%-14s: one shot %8.3f s, streaming by day %8.3f s, max difference %.1e" %
+              (method, t1 - t0, t2 - t1, np.abs(np.concatenate(segments, axis=-1) - smoothed).max()))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
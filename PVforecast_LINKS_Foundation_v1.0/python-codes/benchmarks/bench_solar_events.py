@@ -0,0 +1,55 @@
+'''
+
+*** Benchmark: sunrise and sunset ***
+
+Abstract:
+    Compares the time needed to find the sunrise and sunset of each day of the horizon, for many sites, by scanning the clear
+    sky irradiation (first and last non-zero timestep of each day, forecast_batch included) with the analytic solar_events().
+    The largest difference between the two is reported in minutes (it is about one timestep).
+
+    Usage:
+        python3 benchmarks/bench_solar_events.py [number of sites] [step in seconds] [horizon in days]
+
+'''
+
+import os
+import sys
+import time as tempo
+import datetime
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pv_forecast_engine import forecast_batch, solar_events
+
+TIMEZONE = "Europe/Rome" # all the sites are in Italy
+
+
+def main(argv):
+    n_sites = int(argv[1]) if len(argv) > 1 else 200
+    step = int(argv[2]) if len(argv) > 2 else 60
+    horizon = int(argv[3]) if len(argv) > 3 else 6
+    rng = np.random.default_rng(0)
+    lat = rng.uniform(36, 47, n_sites)
+    lon = rng.uniform(6, 18, n_sites)
+    dt_start = datetime.datetime.combine(datetime.datetime.now().date(), datetime.time(0,0,0))
+    days = [dt_start.date() + datetime.timedelta(days=j) for j in range(horizon)]
+    samples_per_day = int(24*(3600/step))
+
+    t0 = tempo.perf_counter()
+    sim_time_array, irradiation_total = forecast_batch(lat, lon, 0, 0, dt_start, horizon, step, cache=None, timezone=TIMEZONE)
+    daylight = irradiation_total.reshape(n_sites, horizon, samples_per_day) != 0
+    scanned_sunrise = daylight.argmax(axis=-1) * step / 3600
+    scanned_sunset = (samples_per_day - 1 - daylight[..., ::-1].argmax(axis=-1)) * step / 3600
+    t1 = tempo.perf_counter()
+    events = solar_events(lat, lon, days, TIMEZONE)
+    t2 = tempo.perf_counter()
+
+    print("Sites: %d, days: %d, step: %d s" % (n_sites, horizon, step))
+    print("scan of the irradiation : %10.2f ms" % ((t1 - t0) * 1000))
+    print("solar_events            : %10.2f ms" % ((t2 - t1) * 1000))
+    print("max difference          : %10.2f min" % (60 * max(np.abs(scanned_sunrise - events['sunrise']).max(),
+                                                             np.abs(scanned_sunset - events['sunset']).max())))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
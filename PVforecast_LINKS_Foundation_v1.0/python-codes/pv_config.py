@@ -0,0 +1,129 @@
+'''
+
+*** Configuration file store ***
+
+Authors:
+    Hamidreza Mirtaheri,
+    Alessandro Bortoletto
+
+Abstract:
+    In-memory copy of the configuration file (pvforecast.config), where each "[tag]" line is followed by its value, i.e. the
+    first non-empty line which is not a comment. The file is parsed once, and parsed again only when it changes on disk
+    (modification time, size or inode), so the values can be read at every loop without reading the file.
+
+    The values computed by the forecast (e.g. [sunrise] and [sunset]) are changed with update(): all of them are written
+    at once, with a single atomic replacement of the file (temporary file in the same directory, then os.replace), and the
+    file is not written at all if the values did not change.
+
+    Example:
+        config = ConfigStore("/home/PVforecast-Paper/pvforecast.config")
+        sunrise = config.get("sunrise", int, 5)
+        config.update({"sunrise": "06", "sunset": "21"})
+
+'''
+
+# *************************** IMPORT SECTION ***************************
+
+import os
+import tempfile
+import threading
+
+# **********************************************************************
+
+
+def parse_config(lines):
+    '''
+    Parse the lines of a configuration file: return a dictionary {tag: index of the line of its value}.
+    A tag without value (followed by another tag or by the end of the file) is not included.
+    '''
+    values = {}
+    tag = None
+    for i, line in enumerate(lines):
+        line = line.strip()
+        if line == "" or line[0] == "#":
+            continue
+        if line[0] == "[":
+            tag = line[1:-1]
+        elif tag is not None:
+            values.setdefault(tag, i)
+            tag = None
+    return values
+
+
+class ConfigStore(object):
+    '''
+    Configuration file parsed in memory, and parsed again only when the file changes.
+        * file_path: path of the configuration file
+    '''
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        self._signature = None
+        self.lines = []
+        self.values = {}
+        self.reload()
+
+    def _stat(self):
+        stat = os.stat(self.file_path)
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def reload(self):
+        '''
+        Parse the configuration file again.
+        '''
+        with self._lock:
+            signature = self._stat()
+            with open(self.file_path, "r") as f:
+                self.lines = f.readlines()
+            self.values = parse_config(self.lines)
+            self._signature = signature
+
+    def reload_if_changed(self):
+        '''
+        Parse the configuration file again if it changed since it was read. Returns True if it was parsed again.
+        '''
+        if self._stat() == self._signature:
+            return False
+        self.reload()
+        return True
+
+    def get(self, field_name, cast=str, default=None):
+        '''
+        Return the value of a tag (e.g. "sunrise" for "[sunrise]"), or the default value if the tag is not found.
+        '''
+        self.reload_if_changed()
+        index = self.values.get(field_name)
+        if index is None:
+            return default
+        return cast(self.lines[index].strip())
+
+    def update(self, new_values):
+        '''
+        Change the values of some tags ({tag: string}) with a single atomic write of the file.
+        The missing tags are not added. Returns True if the file was written.
+        '''
+        self.reload_if_changed()
+        with self._lock:
+            lines = list(self.lines)
+            for field_name, value in new_values.items():
+                index = self.values.get(field_name)
+                if index is not None:
+                    lines[index] = str(value) + "\n"
+            if lines == self.lines:
+                return False
+            directory = os.path.dirname(os.path.abspath(self.file_path))
+            fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".pvforecast-config-")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    f.writelines(lines)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.chmod(temp_path, os.stat(self.file_path).st_mode & 0o7777)
+                os.replace(temp_path, self.file_path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+            self.lines = lines
+            self._signature = self._stat()
+        return True
@@ -0,0 +1,204 @@
+'''
+
+*** Multi-process forecast of a fleet of sites ***
+
+Authors:
+    Hamidreza Mirtaheri,
+    Alessandro Bortoletto
+
+Abstract:
+    Clear sky irradiation (ASHRAE model) of a large number of sites, computed by a pool of worker processes, so that all the
+    cores are used. The sites are split in shards, one task per shard, and:
+        * the terms which do not depend on the site (ASHRAE coefficients of each timestep, from the lookup table, and the sun
+          declination of each day) are computed once and shared with the workers through shared memory;
+        * each worker computes the solar geometry of the sites of its shard and writes their irradiation in its rows of one
+          (sites x timesteps) array, preallocated in shared memory, so that no result is sent back through a pipe.
+    The result is the same as pv_forecast_engine.forecast_batch(), and it is the shared array itself (not a copy): its shared
+    memory is released when the array, and all the views of it, are deleted.
+
+    Example:
+        with FleetRunner(workers=4) as runner:
+            sim_time_array, irradiation_total = runner.forecast(lat, lon, tilt, declination, dt_start, 6, 60, timezone="Europe/Rome")
+
+'''
+
+# *************************** IMPORT SECTION ***************************
+
+import os
+import datetime
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+
+from pv_forecast_engine import SITES_CHUNK_SIZE, solar_time_terms, sun_declination, site_geometry, clear_sky
+
+# **********************************************************************
+
+# Shards of sites per worker: more than one, so that a worker which is done early takes another shard
+FLEET_SHARDS_PER_WORKER = 4
+# Rows of the shared array of the time dependent terms: A, B, C, cos and sin of the sun declination
+TIME_TERMS = ('A', 'B', 'C', 'cos_sun_declination', 'sin_sun_declination')
+
+
+class SharedArray(object):
+    '''
+    Array of float in shared memory.
+        * shape: shape of the array
+        * name: name of an existing block to attach to, None to create a new block
+    '''
+
+    def __init__(self, shape, name=None):
+        size = int(np.prod(shape)) * np.dtype(float).itemsize
+        if name is None:
+            self.block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        else:
+            self.block = shared_memory.SharedMemory(name=name)
+        self.name = self.block.name
+        self.shape = tuple(shape)
+        self.array = np.ndarray(self.shape, dtype=float, buffer=self.block.buf)
+
+    def close(self, unlink=False):
+        # The array must be dropped before the memory is unmapped
+        self.array = None
+        self.block.close()
+        if unlink:
+            self.block.unlink()
+
+    def detach(self):
+        '''
+        Return the array as the owner of the block: the block is closed and unlinked when the array, and all the views of it,
+        are deleted (or at the exit of the interpreter). The SharedArray must not be closed after it.
+        '''
+        self.array = None
+        return np.asarray(BlockOwner(self.block, self.shape))
+
+
+def release_block(block):
+    try:
+        block.close()
+        block.unlink()
+    except FileNotFoundError:
+        pass
+
+
+class BlockOwner(object):
+    '''
+    Base object of an array in a shared memory block. The views of an array share its base, so the block is kept until no
+    array uses it, then it is released by a finalizer.
+    '''
+
+    def __init__(self, block, shape):
+        # Address of the block: the temporary array is dropped at once, so that the block can be closed later
+        address = np.frombuffer(block.buf, dtype=np.uint8).ctypes.data
+        self.__array_interface__ = dict(version=3, shape=tuple(shape), typestr=np.dtype(float).str, data=(address, False))
+        weakref.finalize(self, release_block, block)
+
+
+def sun_geometry(start, horizon, step):
+    '''
+    Cosine and sine of the sun declination for each timestep of the horizon (the same for all the sites).
+    '''
+    samples_per_day = int(24*(3600/step))
+    first_day = datetime.date(start.year, start.month, start.day)
+    angles = [np.deg2rad(sun_declination((first_day + datetime.timedelta(days=j)).timetuple().tm_yday)) for j in range(horizon)]
+    return np.repeat(np.cos(angles), samples_per_day), np.repeat(np.sin(angles), samples_per_day)
+
+
+def forecast_shard(time_name, result_name, shape, sites, lat, lon, tilt, declination, timezone, start, horizon, step,
+                   chunk_size=SITES_CHUNK_SIZE):
+    '''
+    Task of a worker: clear sky irradiation of the sites of a shard (rows sites of the shared result).
+        * time_name, result_name: names of the shared blocks of the time dependent terms and of the result
+        * shape: shape of the result (N_sites, N_steps)
+        * lat, lon, tilt, declination, timezone: parameters of the sites of the shard
+    Returns the number of sites computed.
+    '''
+    time_terms = SharedArray((len(TIME_TERMS), shape[1]), time_name)
+    result = SharedArray(shape, result_name)
+    try:
+        terms = dict(zip(TIME_TERMS, time_terms.array))
+        for i in range(0, len(lat), chunk_size):
+            chunk = slice(i, i+chunk_size)
+            # The geometry cache of a worker would hold a different shard at each run: it is not used
+            geometry = site_geometry(lat[chunk], lon[chunk], start, horizon, step, None,
+                                     timezone if timezone is None or isinstance(timezone, str) else timezone[chunk])
+            geometry['cos_sun_declination'] = terms['cos_sun_declination']
+            geometry['sin_sun_declination'] = terms['sin_sun_declination']
+            result.array[sites.start+i:sites.start+i+len(lat[chunk])] = clear_sky(terms, geometry, tilt[chunk,None], declination[chunk,None])
+    finally:
+        time_terms.close()
+        result.close()
+    return len(lat)
+
+
+class FleetRunner(object):
+    '''
+    Pool of worker processes computing the clear sky irradiation of many sites.
+        * workers: number of processes, None for the number of cores
+        * shard_size: sites of each task, None to split the sites in FLEET_SHARDS_PER_WORKER shards per worker
+        * chunk_size: sites evaluated together by a worker, as in pv_forecast_engine.forecast_batch()
+    The processes are started at the first forecast() and kept until close().
+    '''
+
+    def __init__(self, workers=None, shard_size=None, chunk_size=SITES_CHUNK_SIZE):
+        self.workers = os.cpu_count() if workers is None else workers
+        self.shard_size = shard_size
+        self.chunk_size = chunk_size
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def forecast(self, lat, lon, tilt, declination, start, horizon, step, timezone=None):
+        '''
+        Compute the clear sky solar irradiation (W/m^2) of the sites, as pv_forecast_engine.forecast_batch().
+            * lat, lon, tilt, declination: arrays of site parameters (scalars are applied to all the sites)
+            * start, horizon, step: as in pv_forecast_engine.forecast()
+            * timezone: timezone name of all the sites, or one name per site, None to find them from the coordinates
+        Returns the arrays (sim_time_array, irradiation_total), where irradiation_total has shape (N_sites, N_steps).
+        '''
+        lat, lon, tilt, declination = np.broadcast_arrays(*[np.asarray(p, dtype=float).reshape(-1) for p in (lat, lon, tilt, declination)])
+        timezones = None if timezone is None or isinstance(timezone, str) else np.asarray(timezone, dtype=object).reshape(-1)
+        terms = solar_time_terms(start, horizon, step)
+        shape = (len(lat), len(terms['sim_time_array']))
+        shard_size = self.shard_size or max(1, -(-len(lat) // (self.workers * FLEET_SHARDS_PER_WORKER)))
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+        time_terms = SharedArray((len(TIME_TERMS), shape[1]))
+        result = SharedArray(shape)
+        irradiation_total = None
+        try:
+            time_terms.array[:3] = [terms['A'], terms['B'], terms['C']]
+            time_terms.array[3:] = sun_geometry(start, horizon, step)
+            futures = []
+            for i in range(0, len(lat), shard_size):
+                sites = slice(i, i+shard_size)
+                futures.append(self._executor.submit(forecast_shard, time_terms.name, result.name, shape, sites,
+                                                     lat[sites], lon[sites], tilt[sites], declination[sites],
+                                                     timezone if timezones is None else timezones[sites], start, horizon, step,
+                                                     self.chunk_size))
+            try:
+                for future in futures:
+                    future.result()
+            except BaseException:
+                # The shards which are not started yet are dropped, since their result would not be used
+                for future in futures:
+                    future.cancel()
+                raise
+            # The result is not copied: the shared block is released when the caller drops the array
+            irradiation_total = result.detach()
+        finally:
+            time_terms.close(unlink=True)
+            if irradiation_total is None:
+                result.close(unlink=True)
+        return terms['sim_time_array'], irradiation_total
@@ -0,0 +1,279 @@
+'''
+
+*** Resident solar radiation forecast daemon ***
+
+Authors:
+    Hamidreza Mirtaheri,
+    Alessandro Bortoletto
+
+Abstract:
+    Python equivalent of "c-codes/pvforecastd.c". Instead of executing the Python script with system() at each loop, the forecast
+    is computed in the same (resident) process: the interpreter, the imported modules and a single MQTT session are kept alive
+    between two consecutive forecasts.
+
+    The daemon reads the same configuration file of the C daemon, and it keeps the same sunrise/sunset gating. The file is
+    parsed once and kept in memory (pv_config.ConfigStore): it is parsed again only when it changes on disk.
+    the forecast is updated only between [sunrise]-1 and [sunset], every [loopSleepSeconds] seconds. With [updateEnabled], the
+    exact sunrise and sunset of each day are computed from the solar geometry of the site instead.
+
+    Usage:
+        python3 pv_forecast_daemon.py [configuration file path]
+
+'''
+
+# *************************** IMPORT SECTION ***************************
+
+import paho.mqtt.client as mqtt
+import sys
+import time as tempo
+import datetime
+import logging
+import asyncio
+import pytz
+
+from pv_weather import WeatherUnlockedProvider
+from pv_publisher import ForecastPublisher
+from pv_weather_cache import WeatherCache
+from pv_prediction_archive import PredictionArchive
+from pv_prediction_index import PredictionIndex
+from pv_forecast_engine import site_forecast, sunrise_sunset
+from pv_smoothing import Smoother
+from pv_intraday import IntradayForecast
+from pv_config import ConfigStore
+from pv_timezone import site_timezone
+from pv_pipeline import ForecastPipeline
+from pv_forecast_script import CONFIG_FILE_PATH, LOG_FILE_PATH, TILT, DECLINATION, update_sunrise_sunset, publish_forecast
+from pv_forecast_script import (WEATHER_CACHE_PATH, ARCHIVE_PATH, LOG_INDEX_PATH, WEATHER_CACHE_SECONDS, PUBLISH_CHUNK_SIZE,
+                                LOG_GZIP, ARCHIVE_ENABLED, LOG_INDEX_ENABLED)
+
+# **********************************************************************
+
+# *********************** CONFIGURATION SECTION ************************
+
+# Log file of the daemon
+DAEMON_LOG_PATH = "/home/PVforecast-Paper/pvforecast.log"
+# Defaults used when a tag is missing in the configuration file (the ones shared with the script are imported from it)
+LOOP_SLEEP_SECONDS = 3600
+DELTA_TOLERANCE = -1
+SMOOTHING_METHOD = "moving_average"
+SMOOTHING_MINUTES = 105
+ENSEMBLE_MEMBERS = 0
+INCREMENTAL_FORECAST = "false"
+ASYNC_PIPELINE = "false"
+SUNRISE = 5
+SUNSET = 22
+UPDATE_ENABLED = "false"
+
+logger = logging.getLogger("pvforecastd")
+
+
+def read_configuration(store):
+    '''
+    Read the forecast and MQTT broker configuration from the configuration file (pv_config.ConfigStore, or path).
+    '''
+    if not isinstance(store, ConfigStore):
+        store = ConfigStore(store)
+    config = dict(loopSleepSeconds=store.get("loopSleepSeconds", int, LOOP_SLEEP_SECONDS),
+                  latitude=store.get("latitude", float),
+                  longitude=store.get("longitude", float),
+                  timestep=store.get("timestep", int),
+                  horizon=store.get("horizon", int),
+                  address=store.get("address"),
+                  port=store.get("port", int),
+                  timezone=store.get("timezone"),
+                  weatherCacheSeconds=store.get("weatherCacheSeconds", int, WEATHER_CACHE_SECONDS),
+                  publishChunkSize=store.get("publishChunkSize", int, PUBLISH_CHUNK_SIZE),
+                  deltaTolerance=store.get("deltaTolerance", float, DELTA_TOLERANCE),
+                  logGzip=store.get("logGzip", str, LOG_GZIP) == "true",
+                  archiveEnabled=store.get("archiveEnabled", str, ARCHIVE_ENABLED) == "true",
+                  logIndexEnabled=store.get("logIndexEnabled", str, LOG_INDEX_ENABLED) == "true",
+                  smoothingMethod=store.get("smoothingMethod", str, SMOOTHING_METHOD),
+                  smoothingMinutes=store.get("smoothingMinutes", float, SMOOTHING_MINUTES),
+                  ensembleMembers=store.get("ensembleMembers", int, ENSEMBLE_MEMBERS),
+                  incrementalForecast=store.get("incrementalForecast", str, INCREMENTAL_FORECAST) == "true",
+                  asyncPipeline=store.get("asyncPipeline", str, ASYNC_PIPELINE) == "true")
+    # The pipeline computes the whole horizon of the site at each forecast: the incremental forecast is not used with it
+    if config['asyncPipeline'] and config['incrementalForecast']:
+        logger.warning("[asyncPipeline] and [incrementalForecast] cannot be used together: the incremental forecast is disabled.")
+        config['incrementalForecast'] = False
+    return config
+
+# **********************************************************************
+
+# *********************** DAEMON SECTION *******************************
+
+def is_daytime(hour, sunrise, sunset):
+    '''
+    The forecast is updated starting from 1 hour before sunrise, and it stops after sunset (all in hours, possibly fractional).
+    '''
+    return not (hour < sunrise-1 or hour > sunset)
+
+
+def new_intraday_forecast(config):
+    '''
+    Incremental intraday forecast (pv_intraday.IntradayForecast) of the configured site.
+    '''
+    smoother = Smoother(config['smoothingMinutes'], config['timestep'], config['smoothingMethod'])
+    return IntradayForecast(config['latitude'], config['longitude'], TILT, DECLINATION, config['horizon'], config['timestep'],
+                            smoother, config['timezone'])
+
+
+def new_pipeline(config, publisher, provider, archive=None, index=None):
+    '''
+    Asynchronous forecast pipeline (pv_pipeline.ForecastPipeline) of the configured site.
+    '''
+    smoother = Smoother(config['smoothingMinutes'], config['timestep'], config['smoothingMethod'])
+    return ForecastPipeline(publisher, provider, config['horizon'], config['timestep'], smoother, config['timezone'],
+                            ensemble_members=config['ensembleMembers'], log_dir=LOG_FILE_PATH, compress_log=config['logGzip'],
+                            index=index, archive=archive, tilt=TILT, declination=DECLINATION)
+
+
+def run_forecast(publisher, config, file_name, provider=None, archive=None, index=None, intraday=None, pipeline=None):
+    '''
+    Compute one forecast and publish it with the publisher (pv_publisher.ForecastPublisher, with an already connected MQTT client).
+    The weather forecast is taken from the provider (see pv_weather), if given. The forecast is also saved in the archive
+    (see pv_prediction_archive) and its log is added to the index (see pv_prediction_index), if given.
+    With intraday (see new_intraday_forecast), only the timesteps from the current one are computed, published and logged.
+    With pipeline (see new_pipeline), the weather forecast is fetched while the clear sky irradiation is computed, and the
+    forecast is published and logged concurrently.
+    The hours of sunrise and sunset are written in the configuration file (path, or pv_config.ConfigStore) if enabled.
+    '''
+    # Without [timezone], the timezone is found from the coordinates (requires timezonefinder)
+    timezone = config['timezone'] or site_timezone(config['latitude'], config['longitude'])
+    # The forecast horizon starts today at 00:00, in the local time of the site
+    now = datetime.datetime.now(pytz.timezone(timezone)).replace(tzinfo=None)
+    dt_start = datetime.datetime.combine(now.date(), datetime.time(0,0,0))
+
+    if pipeline is not None:
+        site = (config['latitude'], config['longitude'])
+        summary = asyncio.run(pipeline.run([site]))[site]
+        if summary['error'] is not None:
+            raise summary['error']
+        stats = summary['publish']
+    elif intraday is None:
+        # Probabilistic forecast: percentiles of [ensembleMembers] realizations of the cloud noise
+        smoother = Smoother(config['smoothingMinutes'], config['timestep'], config['smoothingMethod'])
+        irradiation_total, final_results, WD, quantiles = site_forecast(config['latitude'], config['longitude'], TILT, DECLINATION,
+                                                                        dt_start, config['horizon'], config['timestep'], smoother,
+                                                                        provider, config['ensembleMembers'], timezone)
+        window_start, irradiation_window = dt_start, irradiation_total
+    else:
+        # The clear sky series is reused, the noise is drawn again only if the weather forecast changed
+        if provider is None:
+            provider = WeatherUnlockedProvider()
+        weather = provider.get(config['latitude'], config['longitude'])
+        window_start, irradiation_window, final_results, WD = intraday.update(now, weather)
+        quantiles = intraday.ensemble(config['ensembleMembers']) if config['ensembleMembers'] > 0 else None
+
+    sunrise_time, sunset_time = sunrise_sunset(config['latitude'], config['longitude'], dt_start.date(), timezone)
+    update_sunrise_sunset(file_name, sunrise_time, sunset_time)
+
+    if pipeline is None:
+        stats = publish_forecast(publisher.client, window_start, config['timestep'], irradiation_window, final_results, WD,
+                                 publisher=publisher, site=(config['latitude'], config['longitude']), compress_log=config['logGzip'],
+                                 archive=archive, index=index, quantiles=quantiles, timezone=timezone)
+    logger.info("Published %d samples in %d MQTT messages: %.1f messages/s, %.1f bytes/s",
+                stats['samples'], stats['messages'], stats['messages_per_second'], stats['bytes_per_second'])
+
+
+def main(argv):
+    '''
+    Main loop of the daemon.
+    '''
+    file_name = argv[1] if len(argv) > 1 else CONFIG_FILE_PATH
+
+    logging.basicConfig(filename=DAEMON_LOG_PATH, level=logging.DEBUG,
+                        format="[%(asctime)s] %(levelname)-7s: %(message)s", datefmt="%a %b %d %H:%M:%S %Y")
+
+    # Import the configuration variables from file
+    logger.debug("Reading the configuration file...")
+    store = ConfigStore(file_name)
+    config = read_configuration(store)
+    logger.info("I retrieved the following data from the configuration file: %s", config)
+    # The timezone of the site is resolved once: sunrise, sunset and the forecast horizon are in the local time of the site,
+    # whatever the clock of the host
+    if not config['timezone']:
+        try:
+            config['timezone'] = site_timezone(config['latitude'], config['longitude'])
+        except (ImportError, LookupError) as error:
+            logger.critical("[timezone] is empty and the timezone of the site could not be found: %s", error)
+            sys.exit("[timezone] is empty and the timezone of the site could not be found: %s" % error)
+        logger.info("Timezone of the site: %s", config['timezone'])
+
+    # The weather forecast is downloaded again only when the cached one is older than [weatherCacheSeconds]
+    cache = None
+    if config['weatherCacheSeconds'] > 0:
+        cache = WeatherCache(WEATHER_CACHE_PATH, ttl=config['weatherCacheSeconds'])
+    provider = WeatherUnlockedProvider(cache=cache)
+    archive = PredictionArchive(ARCHIVE_PATH) if config['archiveEnabled'] else None
+    # The logs written before the daemon started (e.g. by the C daemon) are indexed once, as logs of the configured site
+    index = None
+    if config['logIndexEnabled']:
+        index = PredictionIndex(LOG_INDEX_PATH)
+        logger.info("Indexed %d previous prediction logs.", index.update(LOG_FILE_PATH, (config['latitude'], config['longitude'])))
+    # The clear sky series is kept between two forecasts, and only the future timesteps are computed
+    intraday = new_intraday_forecast(config) if config['incrementalForecast'] else None
+
+    # Open the MQTT session only once: paho reconnects automatically in its network thread if the broker drops the connection
+    client = mqtt.Client()
+    client.connect(config['address'], config['port'], 60)
+    client.loop_start()
+    # The publisher is kept between two forecasts, to remember the last published series for the delta publishing.
+    # [publishChunkSize] = 0 means one MQTT message per timestep, [deltaTolerance] < 0 means that all the timesteps are published.
+    publisher = ForecastPublisher(client, chunk_size=config['publishChunkSize'] or None,
+                                  tolerance=config['deltaTolerance'] if config['deltaTolerance'] >= 0 else None)
+    # Weather fetch overlapped with the computation, publishing and logging as independent consumers
+    pipeline = new_pipeline(config, publisher, provider, archive, index) if config['asyncPipeline'] else None
+
+    sun_day, sun_times = None, None
+    logger.info("Starting the main loop now.")
+    try:
+        while True:
+            # Local time of the site (sunrise_sunset() returns local times of the site)
+            now = datetime.datetime.now(pytz.timezone(config['timezone'])).replace(tzinfo=None)
+            if store.reload_if_changed():
+                logger.info("The configuration file changed: sunrise, sunset and updateEnabled are read again.")
+            if store.get("updateEnabled", str, UPDATE_ENABLED) == "true":
+                # Exact sunrise and sunset of today, from the solar geometry of the site (computed once a day, kept in memory)
+                if sun_day != now.date():
+                    sun_times = sunrise_sunset(config['latitude'], config['longitude'], now.date(), config['timezone'])
+                    sun_day = now.date()
+                sunrise_time, sunset_time = sun_times
+                sunrise, sunset = [(t - t.replace(hour=0, minute=0, second=0, microsecond=0)).total_seconds() / 3600
+                                   for t in (sunrise_time, sunset_time)]
+                hour = now.hour + now.minute / 60
+                logger.info("Sunrise and sunset of today: sunrise %s, sunset %s", sunrise_time.strftime("%H:%M"), sunset_time.strftime("%H:%M"))
+            else:
+                # Sunset and sunrise variables from the .config file
+                sunrise = store.get("sunrise", int, SUNRISE)
+                sunset = store.get("sunset", int, SUNSET)
+                hour = now.hour
+                logger.info("I retrieved the following data for sunrise and sunset: sunrise %d, sunset %d", sunrise, sunset)
+
+            # Execute the forecast only during daytime!
+            if not is_daytime(hour, sunrise, sunset):
+                logger.debug("It is night, so I will not update the solar radiation forecast.")
+            else:
+                logger.debug("It is day, I will proceed to update the solar radiation forecast.")
+                try:
+                    run_forecast(publisher, config, store, provider, archive, index, intraday, pipeline)
+                    logger.info("Forecast computed and published.")
+                except Exception:
+                    logger.exception("An error occoured while computing or publishing the forecast.")
+
+            # wait until the next loop
+            logger.info("The daemon is going to sleep for %d seconds.", config['loopSleepSeconds'])
+            tempo.sleep(config['loopSleepSeconds'])
+
+    except KeyboardInterrupt:
+        logger.info("The daemon is going to be closed... Bye bye!")
+
+    # Close the MQTT connections
+    client.loop_stop()
+    client.disconnect()
+    if index is not None:
+        index.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv)
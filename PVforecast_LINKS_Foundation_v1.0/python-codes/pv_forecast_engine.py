@@ -0,0 +1,581 @@
+'''
+
+*** Solar radiation forecast engine ***
+
+Authors:
+    Hamidreza Mirtaheri,
+    Alessandro Bortoletto
+
+Abstract:
+    This module contains the solar geometry and irradiance computations of the PV forecast (ASHRAE Clear Day Solar Flux Model),
+    together with the cloud noise and the smoothing applied to the clear sky curve.
+    Apart from the coefficient tables, nothing is computed at import time, so that a long-lived process can import it once and
+    call forecast() as many times as needed.
+    The solar geometry of each site and day is kept in a LRU cache, so that the hourly re-forecasts (and the sites of a batch
+    already seen) do not compute it again.
+
+    Example:
+        sim_time_array, irradiation_total = forecast(45.065262, 7.659192, 0, 0, dt_start, 2, 60)
+
+'''
+
+# *************************** IMPORT SECTION ***************************
+
+import datetime
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from pv_weather import WeatherUnlockedProvider
+from pv_timezone import site_timezone, utc_offset, day_utc_offsets
+
+# **********************************************************************
+
+# Warnings of the forecast (e.g. a weather forecast shorter than the horizon), in the log of the program which uses the engine
+logger = logging.getLogger(__name__)
+
+# *********************** ASHRAE MODEL SECTION *************************
+
+'''
+We have used ASHRAE model for solar irradiance forecast.
+This lookup table contains coefficients for average clear day solar radiation calculation for the 21th day of each month.
+These values are referred to the ASHRAE Clear Day Solar Flux Model. The table originally comes from ASHRAE Handbook of fundamentals.
+
+https://www.tandfonline.com/doi/pdf/10.1080/15567030701522534
+http://www.me.umn.edu/courses/me4131/LabManual/AppDSolarRadiation.pdf
+
+the first column is indicaing the coefficient value for irradiance throughout the year which is subject to dust and vapor presence in the atmosphere, and its unit is W/m^2.
+second and this columns are other recommended coefficients used for calculation which are dimensionless values.
+
+'''
+
+# this lookup table contains coefficients for average clear day solar radiation calculation for the 21 day of each month
+lookup_table = np.array([
+       [0.000e+00, 0.000e+00, 0.000e+00],
+       [1.230e+03, 1.420e-01, 5.800e-02],
+       [1.215e+03, 1.440e-01, 6.000e-02],
+       [1.186e+03, 1.560e-01, 7.100e-02],
+       [1.136e+03, 1.800e-01, 9.700e-02],
+       [1.104e+03, 1.960e-01, 1.210e-01],
+       [1.088e+03, 2.050e-01, 1.340e-01],
+       [1.085e+03, 2.070e-01, 1.360e-01],
+       [1.107e+03, 2.010e-01, 1.220e-01],
+       [1.151e+03, 1.770e-01, 9.200e-02],
+       [1.192e+03, 1.600e-01, 7.300e-02],
+       [1.221e+03, 1.490e-01, 6.300e-02],
+       [1.233e+03, 1.420e-01, 5.700e-02]])
+
+# The coefficients are given for the 21st of each month: they are linearly interpolated (periodically over the year) to build
+# a table with one row per day of the year (row 0 is unused, as in lookup_table), so that they change smoothly between months.
+LOOKUP_DAYS = [datetime.date(2019, month, 21).timetuple().tm_yday for month in range(1, 13)]
+daily_lookup_table = np.zeros((367, 3))
+for column in range(3):
+    daily_lookup_table[1:, column] = np.interp(np.arange(1, 367), LOOKUP_DAYS, lookup_table[1:, column], period=365)
+
+# The reflect cofficients can be partially retreived from the following dictionary.
+reflect_coeffs = {'browned_grass':0.2,
+                  'bare_soil':0.1,
+                  'fresh_snow':0.87,
+                  'dirty_snow':0.5}
+
+# Number of sites evaluated together by forecast_batch()
+SITES_CHUNK_SIZE = 64
+# Number of random draws (sun or cloud) averaged for each timestep by the cloud noise
+CLOUD_NOISE_DRAWS = 10
+# Number of (site, day, timestep) entries kept in the solar geometry cache: forecast_batch() raises it to the size of the
+# batch, so that a batch computed again is found in the cache, and the memory is bounded by the bytes of the entries
+GEOMETRY_CACHE_SIZE = 2048
+GEOMETRY_CACHE_BYTES = 128 * 1024 * 1024
+# Percentiles of the ensemble forecast, and timesteps of the ensemble members processed together
+ENSEMBLE_QUANTILES = (10, 50, 90)
+ENSEMBLE_SEGMENT_STEPS = 360
+
+# **********************************************************************
+
+# *********************** SOLAR FORECAST SECTION ***********************
+
+def time_horizon(start, horizon, step):
+    '''
+    Build the time axis of the forecast.
+        * start: starting point of the forecast horizon (datetime, usually today at 00:00)
+        * horizon: forecast horizon in days
+        * step: forecast timestep in seconds
+    Returns:
+        * forecast_time_horizon_array: forecast horizon's time steps in hour (particular format in which the 15:45 p.m. is "15.75")
+        * sim_time_array: all the steps of forecast as datetime64 (seconds)
+    The forecast is built day by day, so the step must divide a day in a whole number of timesteps.
+    '''
+    if 24*3600 % step:
+        raise ValueError("The forecast timestep (%s seconds) must divide a day (86400 seconds) in a whole number of timesteps." % step)
+    samples_per_day = int(24*(3600/step))
+    forecast_time_horizon_array = np.concatenate([np.arange(samples_per_day) * (step/3600) for day in range(horizon)])
+    samples = horizon * samples_per_day
+    sim_time_array = np.datetime64(start, 's') + np.arange(samples) * np.timedelta64(int(step), 's')
+    return forecast_time_horizon_array, sim_time_array
+
+
+def days_of_year(sim_time_array):
+    '''
+    Day of the year (1-366) of each step of a datetime64 time axis.
+    '''
+    days = sim_time_array.astype('datetime64[D]')
+    return (days - days.astype('datetime64[Y]')).astype(np.int64) + 1
+
+
+def solar_time_terms(start, horizon, step):
+    '''
+    Compute the terms of the irradiance model which depend only on time (and not on the site).
+        * start: starting point of the forecast horizon (datetime, usually today at 00:00)
+        * horizon: forecast horizon in days
+        * step: forecast timestep in seconds
+    Returns a dictionary of arrays with one entry per forecast timestep.
+    '''
+    forecast_time_horizon_array, sim_time_array = time_horizon(start, horizon, step)
+
+    # ASHRAE coefficients for each timestep, from the daily lookup table
+    day_of_year = days_of_year(sim_time_array)
+    coefficients = daily_lookup_table[day_of_year]
+
+    return dict(sim_time_array=sim_time_array,
+                forecast_time_horizon_array=forecast_time_horizon_array,
+                day_of_year=day_of_year,
+                A=coefficients[:,0],
+                B=coefficients[:,1],
+                C=coefficients[:,2])
+
+
+# *********************** SOLAR GEOMETRY SECTION ***********************
+
+class GeometryCache(object):
+    '''
+    LRU cache of the solar geometry, keyed by (latitude, longitude, timezone, day, step): the least recently used entries are
+    dropped beyond maxsize entries or beyond max_bytes (bytes of the hour angle series). It can be shared between threads.
+    '''
+
+    def __init__(self, maxsize=GEOMETRY_CACHE_SIZE, max_bytes=GEOMETRY_CACHE_BYTES):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def reserve(self, entries, entry_bytes=0):
+        '''
+        Raise maxsize to at least the given number of entries (e.g. sites x days of a batch), since the entries of a batch
+        are looked up in the same order at each run: with a smaller cache, they would be dropped before being used again.
+        For the same reason a batch larger than max_bytes (entry_bytes per entry) would never hit: then the cache is left
+        unchanged and False is returned, so that the batch is computed without the cache.
+        '''
+        with self._lock:
+            if entries * entry_bytes > self.max_bytes:
+                return False
+            self.maxsize = max(self.maxsize, entries)
+        return True
+
+    def get_many(self, keys, compute):
+        '''
+        Return the entries of the given keys. The missing ones are computed together with compute(indexes), which receives
+        the positions of the missing keys and returns their entries in the same order.
+        '''
+        with self._lock:
+            values = [self._entries.get(key) for key in keys]
+            missing = [i for i, value in enumerate(values) if value is None]
+            for key, value in zip(keys, values):
+                if value is not None:
+                    self._entries.move_to_end(key)
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            computed = compute(missing)
+            with self._lock:
+                for i, value in zip(missing, computed):
+                    values[i] = value
+                    if keys[i] in self._entries:
+                        self.nbytes -= self._entries[keys[i]][-1].nbytes
+                    self._entries[keys[i]] = value
+                    self.nbytes += value[-1].nbytes
+                while len(self._entries) > self.maxsize or (self.nbytes > self.max_bytes and self._entries):
+                    key, value = self._entries.popitem(last=False)
+                    self.nbytes -= value[-1].nbytes
+        return values
+
+
+# Cache used by default by forecast() and forecast_batch()
+geometry_cache = GeometryCache()
+
+
+def sun_declination(day_of_year):
+    '''
+    Sun declination angle (degrees), a function of the day of the year (scalar or array).
+    '''
+    return 23.45 * np.sin(np.deg2rad(360/365) * (284 + day_of_year))
+
+
+def equation_of_time(day_of_year):
+    '''
+    Equation of Time (EoT): drift (hours) of the local solar time from the mean solar time, for the day of the year.
+    '''
+    B = np.radians((360/365)*(day_of_year - 81))
+    return (0.1645*np.sin(2*B)) - (0.1255*np.cos(B)) - (0.025*np.sin(B))
+
+
+def _resolve_timezones(lat, lon, timezone):
+    '''
+    Timezone name of each site: timezone is the name of all the sites, one name per site, or None to find them from the
+    coordinates (arrays lat, lon).
+    '''
+    if timezone is None:
+        return [site_timezone(la, lo) for la, lo in zip(lat.tolist(), lon.tolist())]
+    if isinstance(timezone, str):
+        return [timezone] * len(lat)
+    return list(timezone)
+
+
+def _group_by_timezone(timezones, n_columns, offsets):
+    '''
+    Array of shape (N_sites, n_columns) whose row i is offsets(timezones[i]): offsets() is called once for each timezone.
+    '''
+    result = np.empty((len(timezones), n_columns))
+    rows = {}
+    for i, name in enumerate(timezones):
+        rows.setdefault(name, []).append(i)
+    for name, indexes in rows.items():
+        result[indexes] = offsets(name)
+    return result
+
+
+def day_geometry(lat, lon, timezones, day, step):
+    '''
+    Compute the solar geometry of one day for the given sites.
+        * lat, lon: arrays of site coordinates
+        * timezones: timezone name of each site
+        * day: day of the forecast (date)
+        * step: forecast timestep in seconds
+    Returns one tuple per site: (cos and sin of the latitude, cos and sin of the sun declination, cos of the hour angle
+    for each timestep of the day).
+    '''
+    forecast_day = day.timetuple().tm_yday
+    samples_per_day = int(24*(3600/step))
+
+    ### "sun_declination_angle" is a function of specific day of the year.
+    sun_declination_angle = sun_declination(forecast_day)
+
+    ### Equation of Time (EoT) returns the exact local solat time drift from official time, in hours.
+    eot = equation_of_time(forecast_day)
+
+    # This section gets the offset from UTC of the local time of each timestep (daylight saving included), from the tz database.
+    # It is computed once for each timezone, one row per site.
+    time_difference_from_UTC = _group_by_timezone(timezones, samples_per_day, lambda timezone: day_utc_offsets(timezone, day, step))
+
+    # Local Solar Time (lst) calculation: the local time is corrected by the distance from the meridian of the local time
+    lst = np.arange(samples_per_day) * (step/3600) + ((1/15) * (lon[:,None] - time_difference_from_UTC * 15)) + eot
+
+    # solar angle hour
+    h = 15*(lst -12)
+
+    cos_h = np.cos(np.deg2rad(h))
+    cos_lat = np.cos(np.deg2rad(lat))
+    sin_lat = np.sin(np.deg2rad(lat))
+    cos_sun_declination = np.cos(np.deg2rad(sun_declination_angle))
+    sin_sun_declination = np.sin(np.deg2rad(sun_declination_angle))
+    return [(cos_lat[i], sin_lat[i], cos_sun_declination, sin_sun_declination, cos_h[i]) for i in range(len(lat))]
+
+
+def site_geometry(lat, lon, start, horizon, step, cache=geometry_cache, timezone=None):
+    '''
+    Solar geometry of the sites over the forecast horizon, built day by day from the cache (None to compute it without cache).
+        * lat, lon: site coordinates, scalars or arrays
+        * start, horizon, step: as in forecast()
+        * timezone: timezone name of all the sites, or one name per site; if None, it is found from the coordinates
+    Returns a dictionary with cos_lat, sin_lat of shape (N_sites, 1), cos_sun_declination, sin_sun_declination of shape (N_steps,)
+    and cos_h of shape (N_sites, N_steps).
+    '''
+    lat, lon = [np.asarray(p, dtype=float).reshape(-1) for p in (lat, lon)]
+    timezones = _resolve_timezones(lat, lon, timezone)
+    samples_per_day = int(24*(3600/step))
+    geometry = dict(cos_lat=np.empty((len(lat), 1)), sin_lat=np.empty((len(lat), 1)),
+                    cos_sun_declination=np.empty(horizon*samples_per_day), sin_sun_declination=np.empty(horizon*samples_per_day),
+                    cos_h=np.empty((len(lat), horizon*samples_per_day)))
+    first_day = datetime.date(start.year, start.month, start.day)
+    for j in range(horizon):
+        day = first_day + datetime.timedelta(days=j)
+        if cache is None:
+            entries = day_geometry(lat, lon, timezones, day, step)
+        else:
+            keys = [(la, lo, tz, day, step) for la, lo, tz in zip(lat.tolist(), lon.tolist(), timezones)]
+            entries = cache.get_many(keys, lambda missing: day_geometry(lat[missing], lon[missing], [timezones[i] for i in missing], day, step))
+        steps = slice(j*samples_per_day, (j+1)*samples_per_day)
+        for i, (cos_lat, sin_lat, cos_sun_declination, sin_sun_declination, cos_h) in enumerate(entries):
+            geometry['cos_h'][i, steps] = cos_h
+            geometry['cos_lat'][i] = cos_lat
+            geometry['sin_lat'][i] = sin_lat
+        geometry['cos_sun_declination'][steps] = cos_sun_declination
+        geometry['sin_sun_declination'][steps] = sin_sun_declination
+    return geometry
+
+
+def clear_sky(terms, geometry, tilt, declination):
+    '''
+    Compute the clear sky solar irradiation (W/m^2) on the panel, with the ASHRAE Clear Day Solar Flux Model.
+        * terms: time dependent terms, as returned by solar_time_terms()
+        * geometry: solar geometry of the sites, as returned by site_geometry()
+        * tilt, declination: panel parameters, either scalars or arrays of shape (N_sites, 1)
+    The result has shape (N_sites, N_steps).
+    '''
+    cos_lat, sin_lat, cos_h = geometry['cos_lat'], geometry['sin_lat'], geometry['cos_h']
+    cos_sun_declination, sin_sun_declination = geometry['cos_sun_declination'], geometry['sin_sun_declination']
+
+    # Calculation of solar altitude with respect to the exact point of forecast demand. The result is an array of (1, lenght(HORIZON) * 24*(3600/STEP))
+    # at the end, the negative Altitude values are set to zero as it refers to the time that sun is below the horizon
+    sin_altitude = cos_lat*cos_h*cos_sun_declination + sin_lat*sin_sun_declination
+    solar_altitude = np.rad2deg(np.arcsin(sin_altitude))
+    solar_altitude[solar_altitude<0] = 0
+
+    # Solar Azimuth with respect to the point of simulation. The result is an array of (1, lenght(HORIZON) * 24*(3600/STEP)).
+    # It is set to zero for times that the sun's angle with respect to the point of simulation is between 180 and 360 degree.
+    with np.errstate(invalid='ignore'):
+        cos_azimuth =  (1/np.cos(np.deg2rad(solar_altitude))) * ((cos_sun_declination*sin_lat*cos_h)-(sin_sun_declination*cos_lat))
+        arccos_azimuth = np.arccos(cos_azimuth)
+    arccos_azimuth[np.isnan(arccos_azimuth)] = 0.0
+    solar_azimuth = np.rad2deg(arccos_azimuth)
+
+    # Here the declination of the solar PANEL comes into account. This refers to the panel's azimuth.
+    surface_solar_azimuth_values = abs(solar_azimuth - declination)
+
+    # Here the TILT declination of the panel comes into effect.
+    cos_teta = np.cos(np.deg2rad(solar_altitude)) * np.cos(np.deg2rad(surface_solar_azimuth_values)) * np.sin(np.deg2rad(tilt))+\
+    np.sin(np.deg2rad(solar_altitude)) * np.cos(np.deg2rad(tilt))
+    incidence_angle_values = np.arccos(cos_teta)
+
+    # Following lines of scripts compute the Normal Direct Sun Rays Irradiance on the panel, using the ASHRAE constant values from lookup table.
+    zero_values_index = solar_altitude==0
+    solar_altitude[zero_values_index] = 1
+    irradiation_direct_normal = (terms['A'] * np.exp(-terms['B']/(np.sin(np.deg2rad(solar_altitude)))))
+    solar_altitude[zero_values_index] = 0
+    irradiation_direct_normal[zero_values_index]=0
+
+    # Direct flux of sun's rays to the subject panel.
+    direct_flux = irradiation_direct_normal * np.cos(np.deg2rad(incidence_angle_values))
+    diffuse_flux_horizontal = terms['C'] * irradiation_direct_normal
+    diffuse_flux_panel = diffuse_flux_horizontal * ((1+np.cos(np.deg2rad(tilt))) / 2)
+
+    # Accounting another important element of the total irradiation which is reflected radiation.
+    # The reflected radiation highly depends on the surronding environments and covering materials. In the following versions,
+    # finding those coefficient will be the duty of a Machine Learning routine
+    reflected_radiations = reflect_coeffs['browned_grass'] * direct_flux * ((1-np.cos(tilt))/2)
+
+    #The total irradiation which is in a simplified version the sum of direct, diffuse and reflected radiations, considering the sun's angular position.
+    return np.sin(np.deg2rad(solar_altitude)) *  (direct_flux + diffuse_flux_panel + reflected_radiations)
+
+
+def forecast(lat, lon, tilt, declination, start, horizon, step, cache=geometry_cache, timezone=None):
+    '''
+    Compute the clear sky solar irradiation (W/m^2) on the panel, with the ASHRAE Clear Day Solar Flux Model.
+        * lat, lon: location of the panel
+        * tilt: tilt of the panel
+        * declination: declination of the panel (panel's azimuth)
+        * start: starting point of the forecast horizon (datetime in the local time of the site, usually today at 00:00)
+        * horizon: forecast horizon in days
+        * step: forecast timestep in seconds
+        * cache: solar geometry cache (GeometryCache), None to compute the geometry again
+        * timezone: timezone name of the site (e.g. "Europe/Rome"), None to find it from the coordinates (requires timezonefinder)
+    Returns the arrays (sim_time_array, irradiation_total).
+    '''
+    terms = solar_time_terms(start, horizon, step)
+    geometry = site_geometry(lat, lon, start, horizon, step, cache, timezone)
+    irradiation_total = clear_sky(terms, geometry, tilt, declination)[0]
+    return terms['sim_time_array'], irradiation_total
+
+
+def forecast_batch(lat, lon, tilt, declination, start, horizon, step, chunk_size=SITES_CHUNK_SIZE, cache=geometry_cache,
+                   timezone=None):
+    '''
+    Compute the clear sky solar irradiation (W/m^2) for several sites at once.
+        * lat, lon, tilt, declination: arrays of site parameters (scalars are applied to all the sites)
+        * start, horizon, step: as in forecast()
+        * chunk_size: number of sites evaluated together, to bound the memory used by the intermediate arrays
+        * cache: solar geometry cache (GeometryCache), None to compute the geometry again
+        * timezone: timezone name of all the sites, or one name per site, None to find them from the coordinates
+    Returns the arrays (sim_time_array, irradiation_total), where irradiation_total has shape (N_sites, N_steps).
+    '''
+    lat, lon, tilt, declination = np.broadcast_arrays(*[np.asarray(p, dtype=float).reshape(-1) for p in (lat, lon, tilt, declination)])
+    timezones = None if timezone is None or isinstance(timezone, str) else np.asarray(timezone, dtype=object).reshape(-1)
+    terms = solar_time_terms(start, horizon, step)
+    irradiation_total = np.empty((len(lat), len(terms['sim_time_array'])))
+    # Entries of the cache: the hour angle series of one site and one day
+    if cache is not None and not cache.reserve(len(lat) * horizon, int(24*(3600/step)) * np.dtype(float).itemsize):
+        cache = None
+    # Site parameters are column vectors, so that they broadcast against the time axis
+    for i in range(0, len(lat), chunk_size):
+        sites = slice(i, i+chunk_size)
+        geometry = site_geometry(lat[sites], lon[sites], start, horizon, step, cache, timezone if timezones is None else timezones[sites])
+        irradiation_total[sites] = clear_sky(terms, geometry, tilt[sites,None], declination[sites,None])
+    return terms['sim_time_array'], irradiation_total
+
+
+def convolution(array):
+    '''
+    Perform a convolution of the array passed as parameter, to obtain a smooth curve (fixed window of 21 samples).
+    See pv_smoothing for a window in minutes and other filters.
+    '''
+    box_pts = 21
+    box = np.ones(box_pts) / box_pts
+    return np.convolve(array, box, mode='same')
+
+
+def cloud_noise(cloud_array, members=None, rng=None):
+    '''
+    Sample the fraction of the clear sky irradiation which reaches the panel, for each timestep.
+    Each timestep is the mean of CLOUD_NOISE_DRAWS draws, in which the sun is covered with probability equal to the cloud cover,
+    so the whole array is sampled at once from a binomial distribution.
+        * cloud_array: cloud cover for each timestep, between 0 and 1
+        * members: number of independent realizations (Monte-Carlo ensemble members), None for a single realization
+        * rng: numpy.random.Generator to use (e.g. seeded with np.random.default_rng(seed)), None for a new unseeded one
+    Returns an array with the same shape of cloud_array, or of shape (members, len(cloud_array)).
+    '''
+    if rng is None:
+        rng = np.random.default_rng()
+    cloud_array = np.asarray(cloud_array, dtype=float)
+    size = cloud_array.shape if members is None else (members,) + cloud_array.shape
+    return rng.binomial(CLOUD_NOISE_DRAWS, 1 - cloud_array, size=size) / CLOUD_NOISE_DRAWS
+
+
+def addNoise(irradiations, sim_step, lat, lon, rng=None, provider=None, weather=None):
+    '''
+    addNoise function first calls a weather prediction service (WEATHER UNLOCKED) and then applies the effect of
+    cloud presence to the solar irradiation with a simple probability function.
+        * rng: numpy.random.Generator used for the random numbers, if given
+        * provider: weather provider (see pv_weather), WEATHER UNLOCKED if not given
+        * weather: weather forecast already obtained from a provider (pv_weather.WeatherForecast), if given nothing is fetched
+    '''
+    if weather is None:
+        if provider is None:
+            provider = WeatherUnlockedProvider()
+        weather = provider.get(lat, lon)
+    weather_dict = weather.on_grid(sim_step, len(irradiations))
+    if weather_dict.padding() > 0:
+        logger.warning("The weather forecast ends before the forecast horizon: its last values are used for the last %d timesteps.",
+                       weather_dict.padding())
+
+    cloud_array = weather_dict['cloud_total_perceptions']
+    pdfs = cloud_noise(cloud_array / 100, rng=rng)
+    resulting_radiation = irradiations * pdfs
+    return resulting_radiation, weather_dict
+
+
+def ensemble_forecast(irradiations, cloud_array, members, smoother, quantiles=ENSEMBLE_QUANTILES,
+                      segment_steps=ENSEMBLE_SEGMENT_STEPS, rng=None):
+    '''
+    Probabilistic forecast: "members" realizations of the cloud noise are applied to the clear sky irradiation and smoothed,
+    then they are reduced to percentiles for each timestep.
+    The realizations are generated and smoothed (streaming) one segment of timesteps at a time, so the memory is bounded by
+    members x segment_steps values whatever the horizon (the percentiles need all the members of a timestep together).
+        * irradiations: clear sky solar irradiation
+        * cloud_array: cloud cover for each timestep, between 0 and 1
+        * smoother: pv_smoothing.Smoother applied to each realization
+        * quantiles: percentiles to compute
+        * rng: numpy.random.Generator used for the random numbers, if given
+    Returns a dictionary of arrays, one per percentile: {"P10": ..., "P50": ..., "P90": ...}.
+    '''
+    if rng is None:
+        rng = np.random.default_rng()
+    stream = smoother.stream()
+
+    def smoothed_segments():
+        for i in range(0, len(irradiations), segment_steps):
+            yield stream.push(irradiations[i:i+segment_steps] * cloud_noise(cloud_array[i:i+segment_steps], members, rng))
+        yield stream.flush()
+
+    result = np.empty((len(quantiles), len(irradiations)))
+    position = 0
+    for smoothed in smoothed_segments():
+        # The smoother returns the timesteps of each segment only when they are complete
+        steps = smoothed.shape[-1]
+        if steps:
+            result[:, position:position+steps] = np.percentile(smoothed, quantiles, axis=0)
+            position += steps
+    return dict(("P%d" % q, result[j]) for j, q in enumerate(quantiles))
+
+
+def apply_weather(irradiations, weather, sim_step, smoother, ensemble_members=0, rng=None):
+    '''
+    Forecast of a site from its clear sky irradiation and its weather forecast: the cloud noise is applied and the result is
+    smoothed, then the percentiles of the ensemble forecast are computed (if ensemble_members > 0).
+        * weather: weather forecast of the site (pv_weather.WeatherForecast)
+        * smoother: pv_smoothing.Smoother applied to the forecast
+        * rng: numpy.random.Generator used for the random numbers, if given
+    Returns (final_results, WD, quantiles): smoothed forecast, weather forecast on the simulation grid, and percentiles of the
+    ensemble forecast (None without ensemble).
+    '''
+    if rng is None:
+        rng = np.random.default_rng()
+    appliedNoiseIrradiation, WD = addNoise(irradiations, sim_step, None, None, rng=rng, weather=weather)
+    final_results = smoother.smooth(appliedNoiseIrradiation)
+    quantiles = None
+    if ensemble_members > 0:
+        quantiles = ensemble_forecast(irradiations, WD['cloud_total_perceptions'] / 100, ensemble_members, smoother, rng=rng)
+    return final_results, WD, quantiles
+
+
+def site_forecast(lat, lon, tilt, declination, start, horizon, step, smoother, provider=None, ensemble_members=0,
+                  timezone=None, rng=None, cache=geometry_cache):
+    '''
+    Complete forecast of a site: clear sky irradiation (forecast()), weather forecast from the provider (WEATHER UNLOCKED if
+    not given), then cloud noise, smoothing and ensemble (apply_weather()).
+    Returns (irradiation_total, final_results, WD, quantiles).
+    '''
+    sim_time_array, irradiation_total = forecast(lat, lon, tilt, declination, start, horizon, step, cache, timezone)
+    if provider is None:
+        provider = WeatherUnlockedProvider()
+    final_results, WD, quantiles = apply_weather(irradiation_total, provider.get(lat, lon), step, smoother, ensemble_members, rng)
+    return irradiation_total, final_results, WD, quantiles
+
+
+def solar_events(lat, lon, days, timezone=None):
+    '''
+    Sunrise, solar noon and sunset of each day and site, from the same solar geometry of the forecast (sun declination,
+    Equation of Time and UTC offset of the site): the sun is above the horizon when the hour angle is within +-h0, with
+    cos(h0) = -tan(latitude) * tan(declination).
+        * lat, lon: site coordinates, scalars or arrays
+        * days: days (date or list of dates)
+        * timezone: timezone name of all the sites, or one name per site; if None, it is found from the coordinates
+    Returns a dictionary of arrays of shape (N_sites, N_days), with the local clock time of the events in hours (e.g. 5.75 is
+    05:45): "sunrise", "solar_noon", "sunset". During the polar night sunrise = sunset = solar noon, and during the midnight
+    sun sunrise and sunset are 12 hours before and after the solar noon.
+    '''
+    lat, lon = [np.asarray(p, dtype=float).reshape(-1) for p in (lat, lon)]
+    days = [days] if isinstance(days, datetime.date) else list(days)
+    timezones = _resolve_timezones(lat, lon, timezone)
+    day_of_year = np.array([day.timetuple().tm_yday for day in days])
+
+    # UTC offset of the local time at noon of each day (daylight saving included), computed once for each timezone
+    time_difference_from_UTC = _group_by_timezone(timezones, len(days),
+                                                  lambda name: [utc_offset(name, datetime.datetime(day.year, day.month, day.day, 12)) for day in days])
+
+    # Local solar time is 12 at solar noon (hour angle 0), see day_geometry()
+    solar_noon = 12 - ((1/15) * (lon[:,None] - time_difference_from_UTC * 15)) - equation_of_time(day_of_year)
+    cos_h0 = -np.tan(np.deg2rad(lat[:,None])) * np.tan(np.deg2rad(sun_declination(day_of_year)))
+    half_day = np.rad2deg(np.arccos(np.clip(cos_h0, -1, 1))) / 15
+    return dict(sunrise=solar_noon - half_day, solar_noon=solar_noon, sunset=solar_noon + half_day)
+
+
+def sunrise_sunset(lat, lon, day, timezone=None):
+    '''
+    Compute sunrise and sunset (datetime, local time of the site) of a day, with solar_events().
+    '''
+    events = solar_events(lat, lon, day, timezone)
+    midnight = datetime.datetime(day.year, day.month, day.day)
+    sunrise_time = midnight + datetime.timedelta(hours=float(events['sunrise'][0, 0]))
+    sunset_time = midnight + datetime.timedelta(hours=float(events['sunset'][0, 0]))
+    return sunrise_time, sunset_time
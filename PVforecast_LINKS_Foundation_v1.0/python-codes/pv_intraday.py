@@ -0,0 +1,124 @@
+'''
+
+*** Incremental intraday re-forecast ***
+
+Authors:
+    Hamidreza Mirtaheri,
+    Alessandro Bortoletto
+
+Abstract:
+    The forecast horizon starts today at 00:00, but during the day only the timesteps after the current one are published.
+    IntradayForecast keeps the clear sky series of the horizon of a site between two re-forecasts:
+        * the clear sky series is computed once per day, and on a new day only the days added at the end of the horizon are
+          computed (the others are shifted);
+        * at each re-forecast, the cloud noise and the smoothing are applied only from the current timestep (plus the
+          margin needed by the smoothing window), and the noise is drawn again only when a new weather forecast arrives.
+
+    Example:
+        intraday = IntradayForecast(LATITUDE, LONGITUDE, TILT, DECLINATION, 6, 300, Smoother(105, 300), "Europe/Rome")
+        window_start, irradiation, final_results, WD = intraday.update(datetime.datetime.now(), provider.get(LATITUDE, LONGITUDE))
+
+'''
+
+# *************************** IMPORT SECTION ***************************
+
+import datetime
+import numpy as np
+
+from pv_forecast_engine import forecast, cloud_noise, ensemble_forecast, geometry_cache
+
+# **********************************************************************
+
+
+class IntradayForecast(object):
+    '''
+    Forecast of a site, updated incrementally during the day.
+        * lat, lon, tilt, declination, horizon, step, timezone: as in pv_forecast_engine.forecast()
+        * smoother: pv_smoothing.Smoother applied to the forecast
+        * rng: numpy.random.Generator used for the cloud noise, if given
+    After update(), start, sim_time_array and irradiation_total hold the clear sky series of the whole horizon (from 00:00).
+    '''
+
+    def __init__(self, lat, lon, tilt, declination, horizon, step, smoother, timezone=None, rng=None, cache=geometry_cache):
+        self.lat = lat
+        self.lon = lon
+        self.tilt = tilt
+        self.declination = declination
+        self.horizon = horizon
+        self.step = step
+        self.smoother = smoother
+        self.timezone = timezone
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.cache = cache
+        self.samples_per_day = int(24*(3600/step))
+        self.start = None
+        self.sim_time_array = None
+        self.irradiation_total = None
+        # Cloud noise applied to the clear sky series, valid from the timestep _noisy_from, and the weather it was drawn from
+        self._noisy = None
+        self._noisy_from = None
+        self._weather_columns = None
+        self._window = None
+
+    def clear_sky(self, day_start):
+        '''
+        Clear sky series of the horizon starting at day_start (a day at 00:00). Only the days which are not cached are computed.
+        '''
+        shift = None if self.start is None else (day_start - self.start).days
+        if shift is None or not 0 <= shift < self.horizon:
+            self.sim_time_array, self.irradiation_total = forecast(self.lat, self.lon, self.tilt, self.declination, day_start,
+                                                                   self.horizon, self.step, self.cache, self.timezone)
+            self._noisy = None
+        elif shift > 0:
+            # The first days of the cached horizon are gone: the others are kept, and the new days are appended
+            times, irradiation = forecast(self.lat, self.lon, self.tilt, self.declination,
+                                          self.start + datetime.timedelta(days=self.horizon), shift, self.step, self.cache, self.timezone)
+            kept = shift * self.samples_per_day
+            self.sim_time_array = np.concatenate([self.sim_time_array[kept:], times])
+            self.irradiation_total = np.concatenate([self.irradiation_total[kept:], irradiation])
+            self._noisy = None
+        self.start = day_start
+        return self.sim_time_array, self.irradiation_total
+
+    def _same_weather(self, weather):
+        if self._weather_columns is None or self._weather_columns.keys() != weather.columns.keys():
+            return False
+        return all(np.array_equal(self._weather_columns[name], column) for name, column in weather.columns.items())
+
+    def update(self, now, weather):
+        '''
+        Re-forecast from the timestep of now (local time of the site, datetime) to the end of the horizon.
+            * weather: weather forecast of the site (pv_weather.WeatherForecast), whose first timeframe starts at 00:00
+        Returns (window_start, irradiation, final_results, WD): datetime of the first timestep of the window, clear sky and
+        smoothed forecast of the window, and weather forecast on the timesteps of the window.
+        '''
+        day_start = datetime.datetime.combine(now.date(), datetime.time(0,0,0))
+        self.clear_sky(day_start)
+        n = len(self.irradiation_total)
+        first = min(int((now - day_start).total_seconds() // self.step), n - 1)
+        # The smoothing of the first timesteps of the window needs the samples of the previous window
+        margin_start = max(0, first - self.smoother.window)
+        grid = weather.on_grid(self.step, n - margin_start, margin_start)
+        if self._noisy is None or not self._same_weather(weather) or self._noisy_from > margin_start:
+            if self._noisy is None:
+                self._noisy = np.empty(n)
+            cloud_array = grid['cloud_total_perceptions'] / 100
+            self._noisy[margin_start:] = self.irradiation_total[margin_start:] * cloud_noise(cloud_array, rng=self.rng)
+            self._noisy_from = margin_start
+            self._weather_columns = dict((name, column.copy()) for name, column in weather.columns.items())
+        self._window = (first, margin_start, grid)
+
+        final_results = self.smoother.smooth(self._noisy[margin_start:])[first-margin_start:]
+        WD = dict((name, grid[name][first-margin_start:]) for name in grid)
+        window_start = day_start + datetime.timedelta(seconds=first*self.step)
+        return window_start, self.irradiation_total[first:], final_results, WD
+
+    def ensemble(self, members, rng=None):
+        '''
+        Percentiles of the ensemble forecast (see pv_forecast_engine.ensemble_forecast) on the window of the last update().
+        '''
+        first, margin_start, grid = self._window
+        cloud_array = grid['cloud_total_perceptions'] / 100
+        quantiles = ensemble_forecast(self.irradiation_total[margin_start:], cloud_array, members, self.smoother,
+                                      rng=self.rng if rng is None else rng)
+        return dict((name, series[first-margin_start:]) for name, series in quantiles.items())
@@ -0,0 +1,187 @@
+'''
+
+*** Asynchronous forecast pipeline ***
+
+Authors:
+    Hamidreza Mirtaheri,
+    Alessandro Bortoletto
+
+Abstract:
+    asyncio pipeline of the forecast of one or many sites, in a single process. For each site:
+        * the weather forecast is fetched while the clear sky irradiation (ASHRAE model) is computed;
+        * the cloud noise and the smoothing are applied when both are ready;
+        * the result is handed to two independent consumers, one publishing it via MQTT and one writing the prediction log
+          (and the index), so the next sites are computed while the previous ones are still published and logged.
+    The blocking work (HTTP requests, numpy computations, MQTT and file I/O) runs in a pool of threads, and at most
+    max_concurrency sites are in flight at the same time.
+
+    Example:
+        pipeline = ForecastPipeline(publisher, WeatherUnlockedProvider(), horizon=6, step=300, smoother=Smoother(105, 300),
+                                    log_dir="/home/PVforecast-Paper/prediction-logs/")
+        results = asyncio.run(pipeline.run([(45.065262, 7.659192), (41.9, 12.5)]))
+
+'''
+
+# *************************** IMPORT SECTION ***************************
+
+import asyncio
+import datetime
+import time as tempo
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytz
+
+from pv_forecast_engine import forecast, apply_weather
+from pv_publisher import forecast_timestamps, select_timesteps, issue_timestamp, upload_forecast
+from pv_prediction_log import save_forecast
+from pv_timezone import site_timezone
+
+# **********************************************************************
+
+# Sites computed at the same time, and threads used for the blocking work
+PIPELINE_CONCURRENCY = 8
+PIPELINE_WORKERS = 8
+
+
+class ForecastPipeline(object):
+    '''
+    Forecast pipeline of many sites.
+        * publisher: pv_publisher.ForecastPublisher (with an already connected MQTT client), None to skip the publishing
+        * provider: weather provider (see pv_weather)
+        * horizon, step: as in pv_forecast_engine.forecast()
+        * smoother: pv_smoothing.Smoother applied to the forecast
+        * timezone: timezone name of all the sites, None to find the timezone of each site from its coordinates
+        * ensemble_members: members of the ensemble forecast (P10/P50/P90), 0 to disable it
+        * log_dir: directory where the prediction log of each site is written (and added to the index, if given), None to
+          skip the logs
+        * compress_log, index: as in pv_prediction_log.save_forecast()
+        * archive: pv_prediction_archive.PredictionArchive where the forecast is also saved (only for a single site), if given
+        * tilt, declination: panel parameters of all the sites
+        * rng: numpy.random.Generator used for the cloud noise, if given
+    '''
+
+    def __init__(self, publisher, provider, horizon, step, smoother, timezone=None, ensemble_members=0, log_dir=None,
+                 compress_log=False, index=None, archive=None, tilt=0, declination=0, rng=None,
+                 max_concurrency=PIPELINE_CONCURRENCY, max_workers=PIPELINE_WORKERS):
+        self.publisher = publisher
+        self.provider = provider
+        self.horizon = horizon
+        self.step = step
+        self.smoother = smoother
+        self.timezone = timezone
+        self.ensemble_members = ensemble_members
+        self.log_dir = log_dir
+        self.compress_log = compress_log
+        self.index = index
+        self.archive = archive
+        self.tilt = tilt
+        self.declination = declination
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.max_concurrency = max_concurrency
+        self.max_workers = max_workers
+
+    def _compute(self, site):
+        '''
+        Clear sky irradiation of the site, computed while the weather forecast is fetched (in another thread).
+        '''
+        latitude, longitude = site
+        timezone = self.timezone or site_timezone(latitude, longitude)
+        # The forecast horizon starts today at 00:00, in the local time of the site
+        now = datetime.datetime.now(pytz.timezone(timezone))
+        dt_start = datetime.datetime.combine(now.date(), datetime.time(0,0,0))
+        sim_time_array, irradiation_total = forecast(latitude, longitude, self.tilt, self.declination, dt_start, self.horizon,
+                                                     self.step, timezone=timezone)
+        return pytz.timezone(timezone).localize(dt_start), irradiation_total
+
+    def _apply_weather(self, irradiation_total, weather, rng):
+        return apply_weather(irradiation_total, weather, self.step, self.smoother, self.ensemble_members, rng)
+
+    async def forecast_site(self, site, executor, outputs):
+        '''
+        Forecast of a site: the result is put in each queue of outputs.
+        Returns (seconds spent to compute it, error): an error of the weather fetch or of the computation is returned instead
+        of raised, so that the other sites are still computed.
+        '''
+        loop = asyncio.get_running_loop()
+        t0 = tempo.perf_counter()
+        issue_time = issue_timestamp()
+        # Each site has its own generator, since the sites are computed in different threads
+        rng = np.random.default_rng(self.rng.integers(2**63))
+        try:
+            weather, (dt_start, irradiation_total) = await asyncio.gather(
+                loop.run_in_executor(executor, self.provider.get, site[0], site[1]),
+                loop.run_in_executor(executor, self._compute, site))
+            final_results, WD, quantiles = await loop.run_in_executor(executor, self._apply_weather, irradiation_total, weather, rng)
+        except Exception as error:
+            return tempo.perf_counter() - t0, error
+        timestamps, existing = forecast_timestamps(dt_start, self.step, len(final_results))
+        timestamps, irradiation_total, final_results, WD, quantiles = select_timesteps(existing, timestamps, irradiation_total,
+                                                                                       final_results, WD, quantiles)
+        result = dict(site=site, issue_time=issue_time, timestamps=timestamps, irradiation_total=irradiation_total,
+                      final_results=final_results, WD=WD, quantiles=quantiles, start=t0)
+        for queue in outputs:
+            await queue.put(result)
+        return tempo.perf_counter() - t0, None
+
+    def _publish(self, result):
+        return upload_forecast(self.publisher, result['timestamps'], result['final_results'], result['issue_time'],
+                               result['site'], result['quantiles'])
+
+    def _save(self, result):
+        # One log per site: the coordinates are added to the name after the issue time
+        file_name = "log-%s-%.2f_%.2f.csv" % (datetime.datetime.now().strftime('%Y-%m-%d-%H-%M-%S'), result['site'][0], result['site'][1])
+        save_forecast(self.log_dir, result['timestamps'], result['irradiation_total'], result['final_results'], result['WD'],
+                      result['issue_time'], result['site'], self.compress_log, self.archive, self.index, result['quantiles'], file_name)
+
+    async def _consumer(self, queue, handle, executor, results, errors):
+        # The results are handled one at a time, in the order in which they are ready. An error does not stop the consumer,
+        # so that the other sites are still handled: it is reported with the site by run().
+        loop = asyncio.get_running_loop()
+        while True:
+            result = await queue.get()
+            try:
+                output = await loop.run_in_executor(executor, handle, result)
+                results[result['site']] = (output, tempo.perf_counter() - result['start'])
+            except Exception as error:
+                errors.setdefault(result['site'], error)
+            finally:
+                queue.task_done()
+
+    async def run(self, sites):
+        '''
+        Forecast, publish and log all the sites ((latitude, longitude) tuples).
+        Returns a dictionary {site: dict(compute_seconds=..., latency=..., publish=..., error=...)}: seconds to compute the
+        forecast, seconds until it was published and logged (end-to-end), statistics of the publisher, and the exception
+        raised while fetching, computing, publishing or logging the forecast of the site (None if there was none).
+        An error of a site does not stop the others.
+        '''
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        queues, consumers, errors, published, saved = [], [], {}, {}, {}
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        # The consumers have their own thread, so that they never wait for the computations
+        consumer_executor = ThreadPoolExecutor(max_workers=2)
+        for enabled, handle, results in ((self.publisher is not None, self._publish, published), (self.log_dir is not None, self._save, saved)):
+            if enabled:
+                queue = asyncio.Queue(maxsize=self.max_concurrency)
+                queues.append(queue)
+                consumers.append(asyncio.ensure_future(self._consumer(queue, handle, consumer_executor, results, errors)))
+
+        async def bounded(site):
+            async with semaphore:
+                return await self.forecast_site(site, executor, queues)
+
+        try:
+            computed = await asyncio.gather(*[bounded(tuple(site)) for site in sites])
+            for queue in queues:
+                await queue.join()
+        finally:
+            for consumer in consumers:
+                consumer.cancel()
+            executor.shutdown(wait=False)
+            consumer_executor.shutdown(wait=False)
+        summary = {}
+        for site, (compute_seconds, error) in zip([tuple(site) for site in sites], computed):
+            outputs = [results[site] for results in (published, saved) if site in results]
+            summary[site] = dict(compute_seconds=compute_seconds, latency=max([compute_seconds] + [t for output, t in outputs]),
+                                 publish=published[site][0] if site in published else None, error=error or errors.get(site))
+        return summary
@@ -0,0 +1,186 @@
+'''
+
+*** Columnar prediction archive ***
+
+Authors:
+    Hamidreza Mirtaheri,
+    Alessandro Bortoletto
+
+Abstract:
+    Binary alternative to the .csv prediction logs, for backtesting. Each forecast run is appended to the archive of its month
+    (UTC month of the issue time), which has one append-only file per column, with a fixed dtype:
+
+        <archive directory>/YYYY-MM/timestamp.bin    int64, UNIX milliseconds
+        <archive directory>/YYYY-MM/theory.bin       float32, clear sky solar radiation (W/m^2)
+        <archive directory>/YYYY-MM/forecast.bin     float32, forecast solar radiation (W/m^2)
+        <archive directory>/YYYY-MM/cloud_*.bin      float32, cloud cover (%)
+        <archive directory>/YYYY-MM/temperature.bin  float32, temperature (C)
+        <archive directory>/YYYY-MM/runs.bin         (issue_time, offset, length) of each run
+
+    The columns are read with np.memmap, so a whole month is opened without loading it in memory, and the slices of the
+    runs are views on the files (zero-copy). A run is visible only when its entry in runs.bin is complete, and what an
+    interrupted append left in the files is dropped by the next append.
+
+    Example:
+        archive = PredictionArchive("/home/PVforecast-Paper/prediction-archive/")
+        archive.append(issue_time, timestamps, irradiation_total, final_results, WD)
+        month = archive.open_month("2019-07")
+        for run in month.time_range(t_start, t_end):
+            print(run['issue_time'], run['forecast'].mean())
+
+'''
+
+# *************************** IMPORT SECTION ***************************
+
+import os
+import datetime
+import numpy as np
+
+# **********************************************************************
+
+# Columns of the archive: (name, dtype, key of the weather forecast on the simulation grid)
+ARCHIVE_COLUMNS = (('timestamp', np.int64, None),
+                   ('theory', np.float32, None),
+                   ('forecast', np.float32, None),
+                   ('cloud_low', np.float32, 'cloud_low_level'),
+                   ('cloud_mid', np.float32, 'cloud_mid_level'),
+                   ('cloud_high', np.float32, 'cloud_high_level'),
+                   ('cloud_tot', np.float32, 'cloud_total_perceptions'),
+                   ('temperature', np.float32, 'temperature'))
+
+# Index of the runs: issue time (UNIX milliseconds) and position of the run in the columns
+RUNS_DTYPE = np.dtype([('issue_time', np.int64), ('offset', np.int64), ('length', np.int64)])
+
+
+def _read_column(file_path, dtype, length):
+    '''
+    Memory map the first "length" entries of a column file (an empty array if there are none).
+    '''
+    if length == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(file_path, dtype=dtype, mode='r', shape=(length,))
+
+
+def _read_runs(month_dir):
+    '''
+    Memory map the index of the runs of a month.
+    '''
+    runs_path = os.path.join(month_dir, "runs.bin")
+    n_runs = os.path.getsize(runs_path) // RUNS_DTYPE.itemsize if os.path.exists(runs_path) else 0
+    return _read_column(runs_path, RUNS_DTYPE, n_runs)
+
+
+def _rows(runs):
+    '''
+    Number of timesteps of all the (complete) runs.
+    '''
+    if len(runs) == 0:
+        return 0
+    return int(runs['offset'][-1] + runs['length'][-1])
+
+
+class PredictionArchive(object):
+    '''
+    Archive of forecast runs, one sub-directory per month.
+    '''
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def month_of(self, issue_time):
+        '''
+        Month ("YYYY-MM") of the archive where a run issued at issue_time (UNIX milliseconds) is saved.
+        '''
+        return datetime.datetime.fromtimestamp(issue_time / 1000, datetime.timezone.utc).strftime('%Y-%m')
+
+    def months(self):
+        '''
+        Months available in the archive, sorted.
+        '''
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory) if os.path.exists(os.path.join(self.directory, name, "runs.bin")))
+
+    def append(self, issue_time, timestamps, irradiation_total, final_results, WD):
+        '''
+        Append a run to the archive.
+            * issue_time: UNIX milliseconds at which the forecast was computed
+            * timestamps: UNIX milliseconds of each timestep
+            * irradiation_total, final_results: clear sky and forecast solar radiation
+            * WD: weather forecast on the simulation grid
+        Returns the month of the archive.
+        '''
+        month = self.month_of(issue_time)
+        month_dir = os.path.join(self.directory, month)
+        os.makedirs(month_dir, exist_ok=True)
+        n = len(final_results)
+        data = dict(timestamp=timestamps, theory=irradiation_total, forecast=final_results)
+
+        # The columns are written before the run index: a run is visible to the readers only when all its columns are complete
+        runs = _read_runs(month_dir)
+        offset = _rows(runs)
+        for name, dtype, key in ARCHIVE_COLUMNS:
+            column = np.asarray(data[name] if key is None else WD[key], dtype=dtype)[:n]
+            with open(os.path.join(month_dir, name + ".bin"), 'ab') as f:
+                # Drop what was written by an interrupted append
+                f.truncate(offset * np.dtype(dtype).itemsize)
+                f.write(column.tobytes())
+        with open(os.path.join(month_dir, "runs.bin"), 'ab') as f:
+            # Drop a run entry torn by an interrupted append, so that the entries written after it stay aligned
+            f.truncate(len(runs) * RUNS_DTYPE.itemsize)
+            f.write(np.array([(issue_time, offset, n)], dtype=RUNS_DTYPE).tobytes())
+        return month
+
+    def open_month(self, month):
+        '''
+        Open (memory mapped) the archive of a month ("YYYY-MM").
+        '''
+        return ArchiveMonth(os.path.join(self.directory, month))
+
+
+class ArchiveMonth(object):
+    '''
+    Memory mapped archive of one month.
+        * runs: structured array (issue_time, offset, length), one entry per run
+        * columns: dictionary of the memory mapped columns, with all the runs one after the other
+    '''
+
+    def __init__(self, month_dir):
+        self.month_dir = month_dir
+        self.runs = _read_runs(month_dir)
+        self.columns = dict((name, _read_column(os.path.join(month_dir, name + ".bin"), dtype, self.rows()))
+                            for name, dtype, key in ARCHIVE_COLUMNS)
+
+    def rows(self):
+        '''
+        Number of timesteps of all the (complete) runs.
+        '''
+        return _rows(self.runs)
+
+    def run(self, i, start=0, stop=None):
+        '''
+        Columns of the i-th run (views on the memory mapped files), optionally restricted to the timesteps [start:stop].
+        '''
+        offset, length = int(self.runs['offset'][i]), int(self.runs['length'][i])
+        stop = length if stop is None else stop
+        run = dict((name, column[offset+start:offset+stop]) for name, column in self.columns.items())
+        run['issue_time'] = int(self.runs['issue_time'][i])
+        return run
+
+    def time_range(self, t_start, t_end, issue_start=None, issue_end=None):
+        '''
+        Timesteps with t_start <= timestamp < t_end (UNIX milliseconds) of each run, as a list of views (one per run).
+        Only the runs issued in [issue_start, issue_end) are considered, if given. Runs without such timesteps are skipped.
+        '''
+        result = []
+        for i in range(len(self.runs)):
+            issue_time = self.runs['issue_time'][i]
+            if (issue_start is not None and issue_time < issue_start) or (issue_end is not None and issue_time >= issue_end):
+                continue
+            offset, length = int(self.runs['offset'][i]), int(self.runs['length'][i])
+            # The timestamps of a run are sorted
+            timestamps = self.columns['timestamp'][offset:offset+length]
+            start, stop = np.searchsorted(timestamps, [t_start, t_end])
+            if stop > start:
+                result.append(self.run(i, start, stop))
+        return result
@@ -0,0 +1,176 @@
+'''
+
+*** Index of the prediction logs ***
+
+Authors:
+    Hamidreza Mirtaheri,
+    Alessandro Bortoletto
+
+Abstract:
+    SQLite index over the prediction logs (.csv or .csv.gz, see pv_prediction_log), for time-range queries without opening
+    the log files. Each timestep of each forecast run is indexed by (site, target time, issue time), together with the
+    log file, the offset of its line in the (uncompressed) file, and the clear sky and forecast solar radiation:
+
+        points(site_id, target_time, issue_time, log_id, line_offset, theory, forecast)
+
+    The index is updated incrementally: each new log is added when it is written, and update() only reads the logs of a
+    directory which are not indexed yet. The queries return numpy arrays.
+
+    Example:
+        index = PredictionIndex("/home/PVforecast-Paper/prediction-logs/index.sqlite")
+        index.update("/home/PVforecast-Paper/prediction-logs/", site=(LATITUDE, LONGITUDE))
+        # What was forecast for 14:00 tomorrow by the last 24 runs
+        revisions = index.revisions((LATITUDE, LONGITUDE), target_time, last=24)
+
+'''
+
+# *************************** IMPORT SECTION ***************************
+
+import os
+import gzip
+import sqlite3
+import datetime
+import time as tempo
+import numpy as np
+
+# **********************************************************************
+
+# Result of the queries: one entry per indexed timestep
+POINTS_DTYPE = np.dtype([('issue_time', np.int64), ('target_time', np.int64), ('theory', np.float64), ('forecast', np.float64)])
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sites (id INTEGER PRIMARY KEY, latitude REAL NOT NULL, longitude REAL NOT NULL,
+                                  UNIQUE (latitude, longitude));
+CREATE TABLE IF NOT EXISTS logs (id INTEGER PRIMARY KEY, path TEXT NOT NULL UNIQUE, site_id INTEGER NOT NULL,
+                                 issue_time INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS points (site_id INTEGER NOT NULL, target_time INTEGER NOT NULL, issue_time INTEGER NOT NULL,
+                                   log_id INTEGER NOT NULL, line_offset INTEGER NOT NULL, theory REAL, forecast REAL,
+                                   PRIMARY KEY (site_id, target_time, issue_time)) WITHOUT ROWID;
+'''
+
+
+def issue_time_of(file_path):
+    '''
+    Issue time (UNIX milliseconds) of a log, from its name ("log-YYYY-mm-dd-HH-MM-SS.csv", local time).
+    '''
+    name = os.path.basename(file_path)
+    date = datetime.datetime.strptime(name[len("log-"):len("log-YYYY-mm-dd-HH-MM-SS")], '%Y-%m-%d-%H-%M-%S')
+    return int(tempo.mktime(date.timetuple()) * 1000)
+
+
+def read_log_points(file_path):
+    '''
+    Read a prediction log and return, for each timestep, the offset of its line and the values of the first three columns
+    (timestamp, clear sky and forecast solar radiation), as a list of tuples.
+    '''
+    points = []
+    with (gzip.open(file_path, 'rb') if file_path.endswith(".gz") else open(file_path, 'rb')) as f:
+        offset = len(f.readline())
+        for line in f:
+            fields = line.split(b';', 3)
+            points.append((offset, int(fields[0]), float(fields[1]), float(fields[2])))
+            offset += len(line)
+    return points
+
+
+class PredictionIndex(object):
+    '''
+    SQLite index of the prediction logs.
+        * db_path: file of the index (created if missing)
+    '''
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        # The index can be updated by another thread (e.g. the log writer of pv_pipeline), but by one thread at a time
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def _site_id(self, site, create=False):
+        latitude, longitude = site
+        row = self.connection.execute("SELECT id FROM sites WHERE latitude = ? AND longitude = ?", (latitude, longitude)).fetchone()
+        if row is not None:
+            return row[0]
+        if not create:
+            return None
+        return self.connection.execute("INSERT INTO sites (latitude, longitude) VALUES (?, ?)", (latitude, longitude)).lastrowid
+
+    def is_indexed(self, file_path):
+        return self.connection.execute("SELECT 1 FROM logs WHERE path = ?", (os.path.abspath(file_path),)).fetchone() is not None
+
+    def add_log(self, file_path, site, issue_time=None):
+        '''
+        Index a prediction log (nothing is done if it is already indexed).
+            * site: (latitude, longitude) of the forecast
+            * issue_time: UNIX milliseconds at which the forecast was computed (by default, from the name of the file)
+        Returns the number of indexed timesteps.
+        '''
+        if self.is_indexed(file_path):
+            return 0
+        if issue_time is None:
+            issue_time = issue_time_of(file_path)
+        points = read_log_points(file_path)
+        # A single transaction for the whole log
+        with self.connection:
+            site_id = self._site_id(site, create=True)
+            log_id = self.connection.execute("INSERT INTO logs (path, site_id, issue_time) VALUES (?, ?, ?)",
+                                             (os.path.abspath(file_path), site_id, issue_time)).lastrowid
+            self.connection.executemany("INSERT OR REPLACE INTO points VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                        ((site_id, target_time, issue_time, log_id, offset, theory, forecast)
+                                         for offset, target_time, theory, forecast in points))
+        return len(points)
+
+    def update(self, directory, site):
+        '''
+        Index the logs of a directory which are not indexed yet (all the logs of the directory belong to the same site).
+        Returns the number of indexed logs.
+        '''
+        added = 0
+        for name in sorted(os.listdir(directory)):
+            if name.startswith("log-") and (name.endswith(".csv") or name.endswith(".csv.gz")):
+                file_path = os.path.join(directory, name)
+                if not self.is_indexed(file_path):
+                    self.add_log(file_path, site)
+                    added += 1
+        return added
+
+    def _points(self, query, parameters):
+        rows = self.connection.execute(query, parameters).fetchall()
+        return np.array(rows, dtype=POINTS_DTYPE) if rows else np.zeros(0, dtype=POINTS_DTYPE)
+
+    def query(self, site, t_start, t_end, issue_start=None, issue_end=None):
+        '''
+        Timesteps with t_start <= target time < t_end (UNIX milliseconds) of all the indexed runs of a site, optionally only of
+        the runs issued in [issue_start, issue_end). Returns a structured array (POINTS_DTYPE) sorted by target and issue time.
+        '''
+        site_id = self._site_id(site)
+        if site_id is None:
+            return np.zeros(0, dtype=POINTS_DTYPE)
+        return self._points("SELECT issue_time, target_time, theory, forecast FROM points "
+                            "WHERE site_id = ? AND target_time >= ? AND target_time < ? AND issue_time >= ? AND issue_time < ? "
+                            "ORDER BY target_time, issue_time",
+                            (site_id, int(t_start), int(t_end),
+                             -2**63 if issue_start is None else int(issue_start), 2**63-1 if issue_end is None else int(issue_end)))
+
+    def revisions(self, site, target_time, last=None):
+        '''
+        Forecasts of the same target time (UNIX milliseconds) made by successive runs, sorted by issue time: only the last runs
+        if "last" is given. Returns a structured array (POINTS_DTYPE).
+        '''
+        site_id = self._site_id(site)
+        if site_id is None:
+            return np.zeros(0, dtype=POINTS_DTYPE)
+        points = self._points("SELECT issue_time, target_time, theory, forecast FROM points "
+                              "WHERE site_id = ? AND target_time = ? ORDER BY issue_time DESC LIMIT ?",
+                              (site_id, int(target_time), -1 if last is None else int(last)))
+        return points[::-1]
+
+    def locate(self, site, target_time, issue_time):
+        '''
+        Log file and offset of the line of a timestep, or None if it is not indexed.
+        '''
+        return self.connection.execute("SELECT logs.path, points.line_offset FROM points JOIN logs ON logs.id = points.log_id "
+                                       "WHERE points.site_id = ? AND points.target_time = ? AND points.issue_time = ?",
+                                       (self._site_id(site), int(target_time), int(issue_time))).fetchone()
@@ -0,0 +1,97 @@
+'''
+
+*** Prediction log ***
+
+Authors:
+    Hamidreza Mirtaheri,
+    Alessandro Bortoletto
+
+Abstract:
+    Writes the log of a forecast run (.csv, ';' separated) in a single buffered pass, from the arrays of the forecast.
+    The log can also be compressed with gzip (.csv.gz).
+
+    The line has the following format:
+        ['Timestamp', ' Theory_Irradiation', 'Forecast_Irradiation', 'Cloud_Low', 'Cloud_Mid', 'Cloud_High', 'Cloud_Tot', 'Temperature']
+    followed by the percentiles of the ensemble forecast, if any (e.g. 'Forecast_P10', 'Forecast_P50', 'Forecast_P90').
+
+    save_forecast() names the log after the current time, and adds it to the index and to the archive of the predictions.
+
+    Example:
+        write_prediction_log("/home/PVforecast-Paper/prediction-logs/log-2019-07-03-10-00-00.csv",
+                             timestamps, irradiation_total, final_results, WD)
+
+'''
+
+# *************************** IMPORT SECTION ***************************
+
+import os
+import csv
+import gzip
+import logging
+import datetime
+import numpy as np
+
+# **********************************************************************
+
+LOG_TITLE = ['Timestamp', ' Theory_Irradiation', 'Forecast_Irradiation', 'Cloud_Low', 'Cloud_Mid', 'Cloud_High', 'Cloud_Tot', 'Temperature']
+# Size of the write buffer of the log file
+LOG_BUFFER_BYTES = 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def prediction_log_rows(timestamps, irradiation_total, final_results, WD, quantiles=None):
+    '''
+    Rows of the prediction log, built column by column from the arrays of the forecast (one row per timestep).
+    '''
+    n = len(final_results)
+    columns = [timestamps[:n], irradiation_total[:n], final_results[:n],
+               WD['cloud_low_level'][:n], WD['cloud_mid_level'][:n], WD['cloud_high_level'][:n],
+               WD['cloud_total_perceptions'][:n], WD['temperature'][:n]]
+    columns += [np.asarray(series)[:n] for series in (quantiles or {}).values()]
+    # tolist() converts the whole columns to Python numbers at once
+    return zip(*[column.tolist() for column in columns])
+
+
+def write_prediction_log(file_path, timestamps, irradiation_total, final_results, WD, compress=False, quantiles=None):
+    '''
+    Write the prediction log in a single pass.
+        * timestamps: UNIX milliseconds of each timestep
+        * irradiation_total, final_results: clear sky and forecast solar radiation
+        * WD: weather forecast on the simulation grid
+        * compress: if True, the file is compressed with gzip (".gz" is added to file_path)
+        * quantiles: percentiles of the ensemble forecast ({"P10": ..., ...}), added as last columns if given
+    Returns the path of the written file.
+    '''
+    if compress:
+        file_path += ".gz"
+        csv_file = gzip.open(file_path, 'wt', newline='')
+    else:
+        csv_file = open(file_path, 'w', newline='', buffering=LOG_BUFFER_BYTES)
+    with csv_file:
+        csv_writer = csv.writer(csv_file, delimiter=';')
+        csv_writer.writerow(LOG_TITLE + ["Forecast_" + name for name in (quantiles or {})])
+        csv_writer.writerows(prediction_log_rows(timestamps, irradiation_total, final_results, WD, quantiles))
+    return file_path
+
+
+def save_forecast(log_dir, timestamps, irradiation_total, final_results, WD, issue_time, site=None, compress_log=False,
+                  archive=None, index=None, quantiles=None, file_name=None):
+    '''
+    Save the forecast and all the used data in the log file (file_name in the directory log_dir, by default named after the
+    current time), then add it to the index (pv_prediction_index) and to the archive (pv_prediction_archive), if given.
+    The errors of the files are logged, so that the forecast is still published.
+    '''
+    try:
+        fileName = file_name or "log-" + datetime.datetime.now().strftime('%Y-%m-%d-%H-%M-%S') + ".csv"
+        log_path = write_prediction_log(os.path.join(log_dir, fileName), timestamps, irradiation_total, final_results, WD, compress=compress_log,
+                                        quantiles=quantiles)
+        if index is not None:
+            index.add_log(log_path, site, issue_time)
+    except IOError:
+        logger.exception("An error occoured while writing the log file.")
+    if archive is not None:
+        try:
+            archive.append(issue_time, timestamps, irradiation_total, final_results, WD)
+        except IOError:
+            logger.exception("An error occoured while writing the prediction archive.")
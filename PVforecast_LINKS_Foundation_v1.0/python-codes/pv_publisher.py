@@ -0,0 +1,230 @@
+'''
+
+*** MQTT publishing of the forecast ***
+
+Authors:
+    Hamidreza Mirtaheri,
+    Alessandro Bortoletto
+
+Abstract:
+    Publishes the forecast series to the MQTT broker, either one message per timestep:
+
+        {"ts": 1561932000000, "pv_forecast": 123.4}
+
+    or in batches of chunk_size timesteps, in the array format accepted by ThingsBoard telemetry:
+
+        [{"ts": 1561932000000, "values": {"pv_forecast": 123.4}}, {"ts": 1561932060000, "values": {"pv_forecast": 125.0}}, ...]
+
+    The number of messages waiting for the broker acknowledgement never exceeds the in-flight window of the MQTT client,
+    so that the broker is not flooded (the "too many requests" error).
+
+    Other series of the same timesteps (e.g. the percentiles of the ensemble forecast) can be added to each message, with
+    their own keys ("pv_forecast_p10", ...).
+
+    With a delta tolerance, the publisher remembers the last series published for each site and key, and only sends the
+    timesteps which are new, or where any of the values (forecast or percentiles) moved more than the tolerance: the
+    publisher must then be kept between two forecasts.
+
+    forecast_timestamps() gives the timestamps of the timesteps of a forecast (select_timesteps() drops the local clock times
+    which do not exist, at the start of the daylight saving time), and upload_forecast() publishes only the timesteps after
+    the issue time of the forecast.
+
+    Example:
+        publisher = ForecastPublisher(client, chunk_size=500, tolerance=1.0)
+        stats = publisher.publish(timestamps, final_results, site=(LATITUDE, LONGITUDE))
+
+'''
+
+# *************************** IMPORT SECTION ***************************
+
+import json
+import calendar
+import datetime
+import itertools
+import time as tempo
+from collections import deque
+import numpy as np
+import paho.mqtt.client as mqtt
+
+from pv_timezone import utc_offset, local_time_exists
+
+# **********************************************************************
+
+# Topic of the forecast
+FORECAST_TOPIC = 'SolarForecastTopic'
+# Timesteps per message in batched mode
+PUBLISH_CHUNK_SIZE = 500
+# Maximum number of messages waiting for the acknowledgement (paho default is 20)
+MAX_INFLIGHT_MESSAGES = 20
+# Seconds to wait for the acknowledgement of a message
+PUBLISH_TIMEOUT = 30
+
+
+class ForecastPublisher(object):
+    '''
+    Publishes forecast series with an (already connected) MQTT client.
+        * topic: MQTT topic
+        * chunk_size: timesteps per message, None to send one message per timestep ({"ts":..., "pv_forecast":...})
+        * qos: MQTT quality of service
+        * max_inflight: in-flight window, set also on the MQTT client
+        * tolerance: if not None, only the timesteps which are new or changed more than the tolerance (W/m^2) are published
+    '''
+
+    def __init__(self, client, topic=FORECAST_TOPIC, chunk_size=PUBLISH_CHUNK_SIZE, qos=1, max_inflight=MAX_INFLIGHT_MESSAGES,
+                 tolerance=None):
+        self.client = client
+        self.topic = topic
+        self.chunk_size = chunk_size
+        self.qos = qos
+        self.max_inflight = max_inflight
+        self.tolerance = tolerance
+        # Last published series of each site and key: (site, key) -> (timestamps, values)
+        self.last_published = {}
+        client.max_inflight_messages_set(max_inflight)
+
+    def changed(self, timestamps, values, site=None, extra=None):
+        '''
+        Boolean mask of the timesteps to publish: timestamps never published for the site, or where the value of any key
+        ("pv_forecast" and the keys of extra) moved more than the tolerance with respect to the last published value.
+        The last published series of each key of the site is updated.
+        '''
+        timestamps = np.asarray(timestamps)
+        mask = np.zeros(len(timestamps), dtype=bool)
+        series = []
+        for key, column in [("pv_forecast", values)] + list((extra or {}).items()):
+            column = np.asarray(column, dtype=float)
+            last_timestamps, last_values = self.last_published.get((site, key), (np.zeros(0), np.zeros(0)))
+            if len(last_timestamps):
+                index = np.minimum(np.searchsorted(last_timestamps, timestamps), len(last_timestamps) - 1)
+                mask |= (last_timestamps[index] != timestamps) | (np.abs(column - last_values[index]) > self.tolerance)
+                series.append((key, column, last_values[index]))
+            else:
+                mask[:] = True
+                series.append((key, column, None))
+        for key, column, last_values in series:
+            published_values = column.copy()
+            if last_values is not None:
+                # The timesteps not sent keep the values that the broker already has
+                published_values[~mask] = last_values[~mask]
+            self.last_published[(site, key)] = (timestamps.copy(), published_values)
+        return mask
+
+    def payloads(self, timestamps, values, extra=None):
+        '''
+        Build the messages for the given series (timestamps in UNIX milliseconds).
+        extra is an optional dictionary {key: series} of other values sent with each timestep.
+        '''
+        keys = ["pv_forecast"] + list(extra or {})
+        columns = [values] + list((extra or {}).values())
+        rows = zip(timestamps, *columns)
+        if self.chunk_size is None:
+            for row in rows:
+                yield json.dumps(dict([("ts", int(row[0]))] + [(key, float(value)) for key, value in zip(keys, row[1:])]))
+        else:
+            for i in range(0, len(timestamps), self.chunk_size):
+                yield json.dumps([{"ts": int(row[0]), "values": dict((key, float(value)) for key, value in zip(keys, row[1:]))}
+                                  for row in itertools.islice(rows, self.chunk_size)])
+
+    def _wait(self, info):
+        # Messages not sent because the client is disconnected stay in the paho queue, there is nothing to wait for
+        if info.rc == mqtt.MQTT_ERR_SUCCESS:
+            info.wait_for_publish(PUBLISH_TIMEOUT)
+
+    def publish(self, timestamps, values, site=None, extra=None):
+        '''
+        Publish the series (timestamps in UNIX milliseconds, sorted) and wait for all the acknowledgements.
+        The site (any hashable, e.g. (latitude, longitude)) identifies the series for the delta publishing.
+        extra is an optional dictionary {key: series} of other values sent with each timestep (see payloads()).
+        Returns the statistics of the upload: messages, samples, bytes, seconds, messages/s and bytes/s.
+        '''
+        start = tempo.perf_counter()
+        if self.tolerance is not None:
+            mask = self.changed(timestamps, values, site, extra)
+            timestamps, values = np.asarray(timestamps)[mask], np.asarray(values)[mask]
+            if extra is not None:
+                extra = dict((key, np.asarray(series)[mask]) for key, series in extra.items())
+        messages, size = 0, 0
+        pending = deque()
+        for payload in self.payloads(timestamps, values, extra):
+            # Flow control: wait until there is room in the in-flight window
+            while len(pending) >= self.max_inflight:
+                self._wait(pending.popleft())
+            pending.append(self.client.publish(self.topic, payload, self.qos))
+            while pending and pending[0].is_published():
+                pending.popleft()
+            messages += 1
+            size += len(payload)
+        while pending:
+            self._wait(pending.popleft())
+        seconds = tempo.perf_counter() - start
+        return dict(messages=messages, samples=len(timestamps), bytes=size, seconds=seconds,
+                    messages_per_second=messages / seconds if seconds > 0 else 0.0,
+                    bytes_per_second=size / seconds if seconds > 0 else 0.0)
+
+
+def forecast_timestamps(dt_start, step, n, timezone=None):
+    '''
+    Timestamps (UNIX milliseconds) of the n timesteps of a forecast starting at dt_start.
+        * dt_start: local clock time of the site (naive datetime), or aware datetime (pytz)
+        * timezone: timezone name of the site; if None, the timezone of dt_start (if aware) or the one of the system is used
+    The forecast is computed on the local clock of the site, so each timestep takes the UTC offset of its own local time,
+    daylight saving included, as in the engine (pv_timezone.utc_offset, evaluated once per hour).
+    Returns (timestamps, existing): existing is False for the timesteps whose local clock time does not exist (the hour
+    skipped when the daylight saving time starts), which must be dropped with select_timesteps(), since their timestamps
+    would repeat the ones of the following hour. The other timestamps are strictly increasing.
+    '''
+    if timezone is None and dt_start.tzinfo is not None:
+        timezone = getattr(dt_start.tzinfo, 'zone', None)
+    if timezone is None:
+        # THE TIMESTAMPS OF ALL THE TIMESTEPS, in UNIX milliseconds format
+        return int(dt_start.timestamp() * 1000) + np.arange(n, dtype=np.int64) * step * 1000, np.ones(n, dtype=bool)
+    local_start = dt_start.replace(tzinfo=None)
+    midnight = datetime.datetime.combine(local_start.date(), datetime.time(0,0,0))
+    # Local clock time of each timestep, in seconds from the midnight of the first day
+    seconds = (local_start - midnight).total_seconds() + np.arange(n, dtype=np.int64) * step
+    hours = (seconds // 3600).astype(np.int64)
+    local_hours = [midnight + datetime.timedelta(hours=hour) for hour in range(int(hours.max()) + 1 if n else 0)]
+    offsets = np.array([utc_offset(timezone, local_time) for local_time in local_hours])
+    existing = np.array([local_time_exists(timezone, local_time) for local_time in local_hours], dtype=bool)
+    utc_seconds = calendar.timegm(midnight.timetuple()) + seconds - offsets[hours] * 3600
+    return np.round(utc_seconds * 1000).astype(np.int64), existing[hours]
+
+
+def select_timesteps(existing, *series):
+    '''
+    Keep only the timesteps where existing (see forecast_timestamps) is True in each series: an array, a dictionary of
+    arrays (e.g. WD or the quantiles) or None. The series are returned unchanged when all the timesteps exist.
+    '''
+    if existing.all():
+        return series
+
+    def select(values):
+        values = np.asarray(values)[:len(existing)]
+        return values[existing[:len(values)]]
+
+    selected = []
+    for values in series:
+        if values is not None:
+            values = dict((key, select(values[key])) for key in values) if hasattr(values, 'keys') else select(values)
+        selected.append(values)
+    return tuple(selected)
+
+
+def issue_timestamp():
+    '''
+    Timestamp (UNIX milliseconds) at which the forecast is computed.
+    '''
+    ora = datetime.datetime.combine(datetime.datetime.now().date(), datetime.datetime.now().time())
+    return int(tempo.mktime(ora.timetuple()) * 1000)
+
+
+def upload_forecast(publisher, timestamps, final_results, issue_time, site=None, quantiles=None):
+    '''
+    Publish the timesteps of the forecast after issue_time with the publisher (pv_publisher.ForecastPublisher).
+    '''
+    # --> Only the prediction referring to the future is uploaded
+    future = timestamps > issue_time
+    extra = None
+    if quantiles is not None:
+        extra = dict(("pv_forecast_" + name.lower(), series[future]) for name, series in quantiles.items())
+    return publisher.publish(timestamps[future], final_results[future], site, extra)
@@ -0,0 +1,136 @@
+'''
+
+*** Smoothing of the forecast ***
+
+Authors:
+    Hamidreza Mirtaheri,
+    Alessandro Bortoletto
+
+Abstract:
+    Smoothing of the noisy forecast, with a window given in minutes (so that it does not depend on the forecast timestep):
+        * "moving_average": centered moving average, computed with cumulative sums in O(n) whatever the window
+        * "savgol": Savitzky-Golay filter (centered local polynomial fit), which keeps the peaks better than the moving average
+        * "exponential": exponential moving average with time constant equal to the window (causal, so it lags the series)
+
+    The centered filters behave as np.convolve(..., mode='same'), i.e. the series is padded with zeros at both ends.
+    The series can also be smoothed segment by segment (streaming), for very long horizons or many sites, with bounded memory:
+    the concatenation of the smoothed segments is equal to the smoothing of the whole series. Arrays of shape (N_sites, N_steps)
+    are smoothed along the time axis.
+
+    Example:
+        smoother = Smoother(window_minutes=105, step=300)
+        final_results = smoother.smooth(appliedNoiseIrradiation)
+
+        stream = smoother.stream()
+        for segment in segments:
+            publish(stream.push(segment))
+        publish(stream.flush())
+
+'''
+
+# *************************** IMPORT SECTION ***************************
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# **********************************************************************
+
+SMOOTHING_METHODS = ('moving_average', 'savgol', 'exponential')
+# Degree of the polynomial fitted by the Savitzky-Golay filter
+SAVGOL_POLYORDER = 2
+
+
+def window_samples(window_minutes, step):
+    '''
+    Number of samples (odd, at least 1) of a centered window of window_minutes, with timestep step (seconds).
+    '''
+    samples = max(1, int(round(window_minutes * 60 / step)))
+    return samples if samples % 2 == 1 else samples + 1
+
+
+def savgol_coefficients(window, polyorder=SAVGOL_POLYORDER):
+    '''
+    Coefficients of the Savitzky-Golay smoothing filter: value at the center of the least squares polynomial fit of the window.
+    '''
+    half = window // 2
+    vandermonde = np.vander(np.arange(-half, half+1), min(polyorder, window-1) + 1, increasing=True)
+    return np.linalg.pinv(vandermonde)[0]
+
+
+class Smoother(object):
+    '''
+    Smoothing stage of the forecast.
+        * window_minutes: width of the window (or time constant of the exponential filter) in minutes
+        * step: forecast timestep in seconds
+        * method: one of SMOOTHING_METHODS
+    '''
+
+    def __init__(self, window_minutes, step, method='moving_average', polyorder=SAVGOL_POLYORDER):
+        if method not in SMOOTHING_METHODS:
+            raise ValueError("Unknown smoothing method '%s', use one of %s." % (method, ", ".join(SMOOTHING_METHODS)))
+        self.method = method
+        self.window = window_samples(window_minutes, step)
+        self.coefficients = savgol_coefficients(self.window, polyorder) if method == 'savgol' else None
+        # Weight of the new sample in the exponential filter
+        self.alpha = 1 - np.exp(-step / (window_minutes * 60)) if window_minutes > 0 else 1.0
+
+    def stream(self):
+        '''
+        New SmoothingStream, to smooth a series segment by segment.
+        '''
+        return SmoothingStream(self)
+
+    def smooth(self, array):
+        '''
+        Smooth the whole series (along the last axis).
+        '''
+        stream = self.stream()
+        return np.concatenate([stream.push(array), stream.flush()], axis=-1)
+
+    def _filter(self, padded):
+        # Centered filters on the padded series: one output for each complete window ("valid" convolution)
+        if self.method == 'moving_average':
+            cumulative = np.cumsum(padded, axis=-1)
+            zeros = np.zeros(padded.shape[:-1] + (1,))
+            cumulative = np.concatenate([zeros, cumulative], axis=-1)
+            return (cumulative[..., self.window:] - cumulative[..., :-self.window]) / self.window
+        return sliding_window_view(padded, self.window, axis=-1) @ self.coefficients
+
+
+class SmoothingStream(object):
+    '''
+    State of a series smoothed segment by segment: push() returns the smoothed samples which are complete (for the centered
+    filters, the last half window of each segment is returned with the next segment), flush() returns the remaining ones.
+    '''
+
+    def __init__(self, smoother):
+        self.smoother = smoother
+        # Samples kept from the previous segments: the left zero padding at the beginning
+        self.history = None
+        self.last = None
+
+    def push(self, segment):
+        segment = np.asarray(segment, dtype=float)
+        smoother = self.smoother
+        if smoother.method == 'exponential':
+            if segment.shape[-1] == 0:
+                return segment.copy()
+            result = np.empty_like(segment)
+            last = segment[..., 0] if self.last is None else self.last
+            for i in range(segment.shape[-1]):
+                last = smoother.alpha * segment[..., i] + (1 - smoother.alpha) * last
+                result[..., i] = last
+            self.last = last
+            return result
+        if self.history is None:
+            self.history = np.zeros(segment.shape[:-1] + (smoother.window // 2,))
+        padded = np.concatenate([self.history, segment], axis=-1)
+        self.history = padded[..., max(0, padded.shape[-1] - (smoother.window - 1)):]
+        if padded.shape[-1] < smoother.window:
+            return np.zeros(segment.shape[:-1] + (0,))
+        return smoother._filter(padded)
+
+    def flush(self):
+        if self.smoother.method == 'exponential' or self.history is None:
+            return np.zeros(0) if self.last is None else np.zeros(np.shape(self.last) + (0,))
+        return self.push(np.zeros(self.history.shape[:-1] + (self.smoother.window // 2,)))
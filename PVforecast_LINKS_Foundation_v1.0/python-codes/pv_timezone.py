@@ -0,0 +1,85 @@
+'''
+
+*** Site timezones and UTC offsets ***
+
+Authors:
+    Hamidreza Mirtaheri,
+    Alessandro Bortoletto
+
+Abstract:
+    The timezone of a site (IANA name, e.g. "Europe/Rome") is resolved from its coordinates only once, with timezonefinder
+    (optional: without it, the timezone name must be given explicitly). The UTC offsets of the local clock times of the
+    forecast, daylight saving included, are taken from the tz database (pytz), so they are correct for any year and timezone.
+
+    Example:
+        timezone = site_timezone(45.065262, 7.659192)           # "Europe/Rome"
+        offsets = day_utc_offsets(timezone, date(2019, 3, 31), 300)   # 1.0 until 02:00, then 2.0
+
+'''
+
+# *************************** IMPORT SECTION ***************************
+
+import datetime
+from functools import lru_cache
+import numpy as np
+import pytz
+
+try:
+    from timezonefinder import TimezoneFinder
+except ImportError:
+    TimezoneFinder = None
+
+# **********************************************************************
+
+
+@lru_cache(maxsize=None)
+def _timezone_finder():
+    return TimezoneFinder()
+
+
+@lru_cache(maxsize=4096)
+def site_timezone(lat, lon):
+    '''
+    Timezone name of a site, from its coordinates (the result is cached).
+    '''
+    if TimezoneFinder is None:
+        raise ImportError("timezonefinder is required to find the timezone of (%s, %s): install it, or give the timezone name." % (lat, lon))
+    name = _timezone_finder().timezone_at(lat=lat, lng=lon)
+    if name is None:
+        raise LookupError("No timezone found for (%s, %s)." % (lat, lon))
+    return name
+
+
+def utc_offset(timezone, local_time):
+    '''
+    UTC offset (hours, daylight saving included) of a local clock time (naive datetime) in the given timezone.
+    Non-existent and ambiguous times (at the daylight saving changes) take the standard time.
+    '''
+    return pytz.timezone(timezone).localize(local_time, is_dst=False).utcoffset().total_seconds() / 3600
+
+
+def local_time_exists(timezone, local_time):
+    '''
+    False if the local clock time (naive datetime) does not exist in the given timezone, because it is skipped when the
+    daylight saving time starts (e.g. 02:30 of the last Sunday of March in Europe/Rome).
+    '''
+    zone = pytz.timezone(timezone)
+    return zone.normalize(zone.localize(local_time, is_dst=False)).replace(tzinfo=None) == local_time
+
+
+def day_utc_offsets(timezone, day, step):
+    '''
+    UTC offset (hours, daylight saving included) of the local clock time of each forecast timestep of a day.
+        * timezone: timezone name
+        * day: day of the forecast (date)
+        * step: forecast timestep in seconds
+    '''
+    midnight = datetime.datetime(day.year, day.month, day.day)
+    samples_per_day = int(24*(3600/step))
+    first = utc_offset(timezone, midnight)
+    last = utc_offset(timezone, midnight + datetime.timedelta(hours=23))
+    if first == last:
+        return np.full(samples_per_day, first)
+    # The offset changes during the day: it is evaluated for each hour, then repeated for the timesteps of the hour
+    hourly = np.array([utc_offset(timezone, midnight + datetime.timedelta(hours=hour)) for hour in range(24)])
+    return hourly[(np.arange(samples_per_day) * step) // 3600]
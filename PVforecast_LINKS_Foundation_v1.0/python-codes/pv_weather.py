@@ -0,0 +1,225 @@
+'''
+
+*** Weather forecast ingestion ***
+
+Authors:
+    Hamidreza Mirtaheri,
+    Alessandro Bortoletto
+
+Abstract:
+    The weather forecast (WEATHER UNLOCKED) is decoded only once, into one array per variable with one entry per timeframe.
+    The arrays are resampled to the simulation grid (one entry per forecast timestep) only when they are requested, with a
+    linear interpolation between the timeframes (3 hours apart), so that any timestep can be used. The indices and weights of
+    the interpolation depend only on the grid, so they are computed once and reused by all the runs with the same grid.
+    If the weather forecast is shorter than the forecast horizon, the value of the last timeframe is held until the end.
+
+    The weather forecast is obtained from a provider:
+        * WeatherUnlockedProvider: WEATHER UNLOCKED web service (or any HTTP server with the same API, e.g. a local stub)
+        * FileProvider: JSON payloads saved in a local directory, to run the forecast offline
+    Each provider can use a cache (pv_weather_cache.WeatherCache), and it can fetch the forecasts of many sites concurrently.
+
+    Example:
+        provider = WeatherUnlockedProvider()
+        weather_dict = provider.get(LATITUDE, LONGITUDE).on_grid(STEP, len(irradiation_total))
+        cloud_array = weather_dict['cloud_total_perceptions']
+
+'''
+
+# *************************** IMPORT SECTION ***************************
+
+import os
+import json
+import threading
+from functools import lru_cache
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import requests
+
+# **********************************************************************
+
+# WEATHER UNLOCKED service and credentials
+WEATHER_UNLOCKED_URL = 'http://api.weatherunlocked.com/api/forecast/'
+WEATHER_UNLOCKED_ID = '39df55d0'
+WEATHER_UNLOCKED_KEY = 'afce27bf61cdfc4cdd3ae5b5281e39dc'
+# Number of concurrent requests used to fetch the weather forecast of many sites
+FETCH_WORKERS = 8
+
+# Duration of each timeframe of the weather forecast
+TIMEFRAME_SECONDS = 3 * 3600
+
+# Variables of the weather forecast: (name used in the forecast, key in the WEATHER UNLOCKED timeframes)
+WEATHER_FIELDS = (('cloud_total_perceptions', 'cloudtotal_pct'),
+                  ('cloud_low_level', 'cloud_low_pct'),
+                  ('cloud_mid_level', 'cloud_mid_pct'),
+                  ('cloud_high_level', 'cloud_high_pct'),
+                  ('temperature', 'temp_c'))
+
+
+class WeatherForecast(object):
+    '''
+    Weather forecast stored by columns: one array per variable, one entry per timeframe.
+    '''
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    @classmethod
+    def from_json(cls, payload):
+        '''
+        Decode the (already parsed) JSON payload of WEATHER UNLOCKED in a single pass.
+        '''
+        timeframes = [timeframe for day in payload['Days'] for timeframe in day['Timeframes']]
+        columns = dict((name, np.empty(len(timeframes))) for name, key in WEATHER_FIELDS)
+        for i, timeframe in enumerate(timeframes):
+            for name, key in WEATHER_FIELDS:
+                columns[name][i] = timeframe[key]
+        return cls(columns)
+
+    def __len__(self):
+        return len(self.columns[WEATHER_FIELDS[0][0]])
+
+    def on_grid(self, sim_step, n_steps=None, first_step=0):
+        '''
+        Return the weather forecast on the simulation grid with timestep sim_step (seconds) and n_steps timesteps
+        (by default, the timesteps covered by the weather forecast), starting from the timestep first_step.
+        '''
+        return WeatherGrid(self, sim_step, n_steps, first_step)
+
+
+@lru_cache(maxsize=64)
+def interpolation_weights(n_frames, sim_step, n_steps, first_step=0):
+    '''
+    Indices and weights of the linear interpolation of n_frames timeframes on a grid of n_steps timesteps of sim_step seconds,
+    starting from the timestep first_step (cached, read-only arrays). The value at timestep k is
+        column[index[k]] * (1 - weight[k]) + column[index[k] + 1] * weight[k]
+    where column has the value of the last timeframe appended, so that after the last timeframe its value is held (padding).
+    '''
+    seconds = np.arange(first_step, first_step + n_steps) * sim_step
+    index = (seconds // TIMEFRAME_SECONDS).astype(np.intp)
+    weight = (seconds - index * TIMEFRAME_SECONDS) / TIMEFRAME_SECONDS
+    # Padding of the horizon: the timesteps after the last timeframe take its value
+    padded = index >= n_frames - 1
+    index[padded] = n_frames - 1
+    weight[padded] = 0.0
+    index.setflags(write=False)
+    weight.setflags(write=False)
+    return index, weight
+
+
+class WeatherGrid(Mapping):
+    '''
+    Read-only dictionary of the weather variables on the simulation grid.
+    Each variable is interpolated on the grid (see interpolation_weights) the first time it is requested.
+    '''
+
+    def __init__(self, weather, sim_step, n_steps=None, first_step=0):
+        self.weather = weather
+        self.sim_step = sim_step
+        self.first_step = first_step
+        self.n_steps = self.size() if n_steps is None else n_steps
+        self.index, self.weight = interpolation_weights(len(weather), sim_step, self.n_steps, first_step)
+        self._expanded = {}
+
+    def __getitem__(self, name):
+        if name not in self._expanded:
+            column = self.weather.columns[name]
+            column = np.append(column, column[-1])
+            self._expanded[name] = column[self.index] * (1 - self.weight) + column[self.index + 1] * self.weight
+        return self._expanded[name]
+
+    def __iter__(self):
+        return iter(self.weather.columns)
+
+    def __len__(self):
+        return len(self.weather.columns)
+
+    def size(self):
+        '''
+        Number of timesteps of the grid covered by the weather forecast (the last timeframe lasts TIMEFRAME_SECONDS).
+        '''
+        return max(0, int(-(-len(self.weather) * TIMEFRAME_SECONDS // self.sim_step)) - self.first_step)
+
+    def padding(self):
+        '''
+        Number of timesteps of the grid after the end of the weather forecast (they hold the value of the last timeframe).
+        '''
+        return max(0, self.n_steps - self.size())
+
+
+# *********************** WEATHER PROVIDERS SECTION ********************
+
+class WeatherProvider(object):
+    '''
+    Base class of the weather forecast providers: subclasses implement fetch(lat, lon), which returns the JSON payload
+    (in the WEATHER UNLOCKED format) of the weather forecast for a site.
+        * cache: optional pv_weather_cache.WeatherCache, used before calling fetch()
+    '''
+
+    def __init__(self, cache=None):
+        self.cache = cache
+
+    def fetch(self, lat, lon):
+        raise NotImplementedError
+
+    def get(self, lat, lon):
+        '''
+        Return the weather forecast (WeatherForecast) for a site.
+        '''
+        if self.cache is None:
+            payload = self.fetch(lat, lon)
+        else:
+            payload = self.cache.get(lat, lon, self.fetch)
+        return WeatherForecast.from_json(payload)
+
+    def get_many(self, lats, lons, max_workers=FETCH_WORKERS):
+        '''
+        Return the weather forecasts (list of WeatherForecast) for many sites, fetched concurrently.
+        '''
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(self.get, lats, lons))
+
+
+class WeatherUnlockedProvider(WeatherProvider):
+    '''
+    Weather forecast from the WEATHER UNLOCKED web service. The url can point to any server with the same API (e.g. a local stub).
+    One HTTP session is kept for each thread, so that the connections are reused between requests.
+    '''
+
+    def __init__(self, app_id=WEATHER_UNLOCKED_ID, app_key=WEATHER_UNLOCKED_KEY, url=WEATHER_UNLOCKED_URL, cache=None, timeout=30):
+        WeatherProvider.__init__(self, cache)
+        self.app_id = app_id
+        self.app_key = app_key
+        self.url = url
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def fetch(self, lat, lon):
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        url = self.url+str(lat)+','+str(lon)+'?app_id='+self.app_id+'&app_key='+self.app_key
+        response = self._local.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+
+class FileProvider(WeatherProvider):
+    '''
+    Weather forecast from JSON payloads (WEATHER UNLOCKED format) saved in a directory.
+    The payload of a site is "<latitude>_<longitude>.json" (2 decimals), otherwise "default.json" is used for every site.
+    Each file is read only once.
+    '''
+
+    def __init__(self, directory, cache=None):
+        WeatherProvider.__init__(self, cache)
+        self.directory = directory
+        self._payloads = {}
+
+    def fetch(self, lat, lon):
+        file_path = os.path.join(self.directory, "%.2f_%.2f.json" % (lat, lon))
+        if not os.path.exists(file_path):
+            file_path = os.path.join(self.directory, "default.json")
+        if file_path not in self._payloads:
+            with open(file_path, "r") as f:
+                self._payloads[file_path] = json.load(f)
+        return self._payloads[file_path]
@@ -0,0 +1,164 @@
+'''
+
+*** On-disk weather forecast cache ***
+
+Authors:
+    Hamidreza Mirtaheri,
+    Alessandro Bortoletto
+
+Abstract:
+    Local cache of the weather forecast payloads (WEATHER UNLOCKED), to avoid a new request at each forecast cycle.
+    Each payload is saved as a JSON file, keyed by the rounded location and by the time at which it was downloaded (issue time):
+
+        <cache directory>/<latitude>_<longitude>/<issue UNIX timestamp>.json
+
+    A payload is reused while it is younger than the TTL. When the cache exceeds its maximum size, the oldest payloads are deleted.
+    The directory is scanned only once: then the size of the cache is updated at each payload stored or deleted, so that a
+    store does not list all the files again. The cache can be shared between threads.
+
+    In replay mode the cache never downloads anything: the recorded payloads are fed back to the forecast, so that the whole
+    pipeline can be run (and benchmarked) deterministically and without network.
+
+    Example:
+        cache = WeatherCache("/home/PVforecast-Paper/weather-cache/", ttl=3*3600)
+        provider = WeatherUnlockedProvider(cache=cache)
+
+'''
+
+# *************************** IMPORT SECTION ***************************
+
+import os
+import json
+import heapq
+import threading
+import time as tempo
+
+# **********************************************************************
+
+# Decimals of latitude and longitude used in the cache key (0.01 degrees is about 1 km)
+LOCATION_DECIMALS = 2
+# Default time to live of a payload
+CACHE_TTL_SECONDS = 3 * 3600
+# Default maximum size of the cache
+CACHE_MAX_BYTES = 50 * 1024 * 1024
+
+
+class WeatherCache(object):
+    '''
+    On-disk cache of weather forecast payloads, with TTL, size-based eviction and replay mode.
+        * cache_dir: directory of the cache (created if missing)
+        * ttl: seconds after which a payload is downloaded again
+        * max_bytes: maximum size of the cache, the oldest payloads are deleted beyond it
+        * replay: if True, only the recorded payloads are used (the TTL is ignored and nothing is downloaded)
+    '''
+
+    def __init__(self, cache_dir, ttl=CACHE_TTL_SECONDS, max_bytes=CACHE_MAX_BYTES, replay=False):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.replay = replay
+        os.makedirs(cache_dir, exist_ok=True)
+        # Index of the payloads for the eviction: size of each file, total size, and heap of (issue time, file) from the oldest.
+        # It is built at the first eviction, and a file stored again is in the heap twice (the older entry is skipped).
+        self._lock = threading.Lock()
+        self._sizes = None
+        self._oldest = []
+        self._total = 0
+
+    def _location_dir(self, lat, lon):
+        return os.path.join(self.cache_dir, "%.*f_%.*f" % (LOCATION_DECIMALS, lat, LOCATION_DECIMALS, lon))
+
+    def issue_times(self, lat, lon):
+        '''
+        Issue times (UNIX seconds) of the payloads recorded for a location, sorted from the oldest.
+        '''
+        location_dir = self._location_dir(lat, lon)
+        if not os.path.isdir(location_dir):
+            return []
+        return sorted(int(name[:-len(".json")]) for name in os.listdir(location_dir) if name.endswith(".json"))
+
+    def load(self, lat, lon, issue_time):
+        '''
+        Load the payload recorded for a location at the given issue time.
+        '''
+        with open(os.path.join(self._location_dir(lat, lon), "%d.json" % issue_time), "r") as f:
+            return json.load(f)
+
+    def store(self, lat, lon, payload, issue_time=None):
+        '''
+        Record a payload for a location (atomically), then apply the size-based eviction.
+        '''
+        if issue_time is None:
+            issue_time = int(tempo.time())
+        location_dir = self._location_dir(lat, lon)
+        os.makedirs(location_dir, exist_ok=True)
+        file_path = os.path.join(location_dir, "%d.json" % issue_time)
+        # The temporary file is unique to the thread, since two threads may store the same payload at the same time
+        temp_path = "%s.%d.tmp" % (file_path, threading.get_ident())
+        with open(temp_path, "w") as f:
+            json.dump(payload, f)
+        size = os.path.getsize(temp_path)
+        os.replace(temp_path, file_path)
+        with self._lock:
+            if self._sizes is not None:
+                self._add(issue_time, size, file_path)
+        self.evict()
+
+    def get(self, lat, lon, fetch, now=None):
+        '''
+        Return the weather forecast payload for a location.
+            * fetch: function fetch(lat, lon) which downloads the payload, called only if there is no valid payload in the cache
+            * now: current time (UNIX seconds); in replay mode, the most recent payload issued before "now" is returned
+              (the most recent recorded one, if "now" is not given)
+        '''
+        if now is None:
+            now = float("inf") if self.replay else tempo.time()
+        issue_times = [t for t in self.issue_times(lat, lon) if t <= now]
+        if self.replay:
+            if not issue_times:
+                raise LookupError("No recorded weather forecast for (%s, %s)." % (lat, lon))
+            return self.load(lat, lon, issue_times[-1])
+        if issue_times and now - issue_times[-1] < self.ttl:
+            return self.load(lat, lon, issue_times[-1])
+        payload = fetch(lat, lon)
+        self.store(lat, lon, payload, int(now))
+        return payload
+
+    def _add(self, issue_time, size, file_path):
+        self._total += size - self._sizes.get(file_path, 0)
+        self._sizes[file_path] = size
+        heapq.heappush(self._oldest, (issue_time, file_path))
+
+    def _scan(self):
+        # Payloads already in the directory (e.g. recorded by a previous run); a file deleted meanwhile is skipped
+        self._sizes, self._oldest, self._total = {}, [], 0
+        for location in os.listdir(self.cache_dir):
+            location_dir = os.path.join(self.cache_dir, location)
+            if not os.path.isdir(location_dir):
+                continue
+            for name in os.listdir(location_dir):
+                if name.endswith(".json"):
+                    file_path = os.path.join(location_dir, name)
+                    try:
+                        self._add(int(name[:-len(".json")]), os.path.getsize(file_path), file_path)
+                    except FileNotFoundError:
+                        pass
+
+    def evict(self):
+        '''
+        Delete the oldest payloads (of any location) until the cache is smaller than max_bytes.
+        '''
+        with self._lock:
+            if self._sizes is None:
+                self._scan()
+            while self._total > self.max_bytes and self._oldest:
+                issue_time, file_path = heapq.heappop(self._oldest)
+                size = self._sizes.pop(file_path, None)
+                if size is None:
+                    # Older entry of a file stored again, already deleted
+                    continue
+                self._total -= size
+                try:
+                    os.remove(file_path)
+                except FileNotFoundError:
+                    pass
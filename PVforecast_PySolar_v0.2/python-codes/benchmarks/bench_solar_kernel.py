@@ -0,0 +1,77 @@
+'''
+
+*** Benchmark: vectorized solar kernel against pysolar ***
+
+Abstract:
+    Compares the previous solar radiation computation (np.vectorize over pysolar, one call per timezone-aware datetime)
+    with pv_solar_kernel (arrays of UNIX timestamps), at 1-minute step over a 6-day horizon.
+    It reports the throughput of both paths and the maximum differences, to be checked against the tolerance of pv_solar_kernel.
+
+    Usage:
+        python3 benchmarks/bench_solar_kernel.py
+
+'''
+
+import os
+import sys
+import time as tempo
+import warnings
+import numpy as np
+from datetime import *
+import pytz as tz
+import pysolar
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import pv_solar_kernel
+
+LATITUDE = 45.065262
+LONGITUDE = 7.659192
+STEP = 60 # [seconds]
+FORECAST_HORIZON = 6 # [days]
+
+
+def pysolar_path(sim_time_array):
+    '''
+    The per-sample pysolar computation, as done before pv_solar_kernel.
+    '''
+    alt_func_vect = np.vectorize(lambda t: pysolar.solar.get_altitude(LATITUDE, LONGITUDE, t))
+    altitudes = alt_func_vect(sim_time_array)
+    rad_func_vect = np.vectorize(lambda dateArray, altitude_deg: pysolar.radiation.get_radiation_direct(dateArray, altitude_deg))
+    radiations = rad_func_vect(sim_time_array, altitudes)
+    radiations[altitudes <= 0] = 0
+    return altitudes, radiations
+
+
+def kernel_path(sim_timestamps):
+    altitudes = pv_solar_kernel.get_altitude(LATITUDE, LONGITUDE, sim_timestamps)
+    radiations = pv_solar_kernel.get_radiation_direct(sim_timestamps, altitudes)
+    radiations[altitudes <= 0] = 0
+    return altitudes, radiations
+
+
+def main():
+    warnings.simplefilter('ignore')
+    dt_start = tz.timezone("Europe/Rome").localize(datetime.combine(datetime.now().date(), time(0,0,0)))
+    sim_timestamps = dt_start.timestamp() + np.arange(0, FORECAST_HORIZON * 86400, STEP)
+    sim_time_array = [datetime.fromtimestamp(t, timezone.utc) for t in sim_timestamps]
+
+    t0 = tempo.perf_counter()
+    ref_altitudes, ref_radiations = pysolar_path(sim_time_array)
+    pysolar_time = tempo.perf_counter() - t0
+
+    t0 = tempo.perf_counter()
+    altitudes, radiations = kernel_path(sim_timestamps)
+    kernel_time = tempo.perf_counter() - t0
+
+    n = len(sim_timestamps)
+    above = ref_altitudes > 0
+    high = ref_altitudes > 5
+    print("Samples: %d (step %d s, horizon %d days)" % (n, STEP, FORECAST_HORIZON))
+    print("pysolar + np.vectorize : %12.0f samples/s" % (n / pysolar_time))
+    print("pv_solar_kernel        : %12.0f samples/s (x%.0f)" % (n / kernel_time, pysolar_time / kernel_time))
+    print("Max altitude difference (sun above horizon): %.4f deg" % np.abs(altitudes - ref_altitudes)[above].max())
+    print("Max radiation difference (altitude > 5 deg): %.4f W/m^2" % np.abs(radiations - ref_radiations)[high].max())
+
+
+if __name__ == '__main__':
+    main()
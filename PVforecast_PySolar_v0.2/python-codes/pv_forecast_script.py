@@ -35,12 +35,16 @@ import sys
 import json
 import random
 import time as tempo
-import pysolar
 import numpy as np
 from datetime import *
 import pytz as tz
 import requests
 import csv
+import pv_solar_kernel
+try:
+    from timezonefinder import TimezoneFinder
+except ImportError:
+    TimezoneFinder = None
 
 # **********************************************************************
 
@@ -217,25 +221,24 @@ def addNoise(irrad, sim_step, lat, lon):
     resulting_radiation = irradiations * pdfs
     return resulting_radiation, weather_dict
 
-# Setup the start and end time of the prediction
-dt_start = datetime.combine(datetime.now().date(), time(0,0,0,tzinfo=tz.timezone("Europe/Rome")))
-dt_end = datetime.combine(datetime.now().date() + timedelta(days=FORECAST_HORIZON), time(0,0,0,tzinfo=tz.timezone("Europe/Rome")))
-
-# Get solar altitudes for the specified location, and compute the solar radiation
-alt_func = lambda t: pysolar.solar.get_altitude(LATITUDE, LONGITUDE, t)
-alt_func_vect = np.vectorize(alt_func)
-sim_time_array = np.arange(dt_start, dt_end, timedelta(seconds=STEP)).astype(datetime)
-
-# The following line of code is to assign a correct timezone awareness to each entry of the array
-new_array = []
-for i in range(len(sim_time_array)):
-	new_array.append(sim_time_array[i].replace(tzinfo=tz.timezone("Europe/Rome")))
-sim_time_array = new_array
-
-altitudes = alt_func_vect(sim_time_array)
-rad_func = lambda dateArray, altitude_deg: pysolar.radiation.get_radiation_direct(dateArray, altitude_deg)
-rad_func_vect = np.vectorize(rad_func)
-radiations = rad_func_vect(sim_time_array, altitudes)
+# Timezone of the site, from its coordinates (requires timezonefinder)
+if TimezoneFinder is None:
+    raise ImportError("timezonefinder is required to find the timezone of (%s, %s): install it." % (LATITUDE, LONGITUDE))
+timezone_name = TimezoneFinder().timezone_at(lat=LATITUDE, lng=LONGITUDE)
+if timezone_name is None:
+    raise LookupError("No timezone found for (%s, %s)." % (LATITUDE, LONGITUDE))
+site_timezone = tz.timezone(timezone_name)
+
+# Setup the start and end time of the prediction (today at 00:00 in the local time of the site)
+dt_start = site_timezone.localize(datetime.combine(datetime.now(site_timezone).date(), time(0,0,0)))
+dt_end = dt_start + timedelta(days=FORECAST_HORIZON)
+
+# Timestamps (UNIX seconds) of all the steps of the forecast
+sim_timestamps = dt_start.timestamp() + np.arange(0, FORECAST_HORIZON * 86400, STEP)
+
+# Get solar altitudes for the specified location, and compute the solar radiation (same model of pysolar, vectorized)
+altitudes = pv_solar_kernel.get_altitude(LATITUDE, LONGITUDE, sim_timestamps)
+radiations = pv_solar_kernel.get_radiation_direct(sim_timestamps, altitudes)
 radiations[altitudes <= 0] = 0
 irradiations = radiations * np.sin(np.deg2rad(altitudes))
 
@@ -265,8 +268,8 @@ client.loop_start()
 # Declare data format
 sensor_data = {"ts":0, "values":{"pv_forecast":0}}
 # THE TIMESTAMP ARE 1 HOUR EARLIER BECAUSE IN UTC FORMAT
-dt_start_TIMESTAMP = tempo.mktime(dt_start.timetuple())
-dt_end_TIMESTAMP = tempo.mktime(dt_end.timetuple())
+dt_start_TIMESTAMP = dt_start.timestamp()
+dt_end_TIMESTAMP = dt_end.timestamp()
 # THE CURRENT TIMESTAMP VARIABLE, in UNIX milliseconds format
 current_TIMESTAMP = int(dt_start_TIMESTAMP * 1000)
 